@@ -0,0 +1,390 @@
+"""
+Runs the benchmark suite and writes the results as JSON. From the root of the
+repository:
+
+    python -m benchmarks --groups 1 5 --cohorts 0 2 --output results.json
+
+Run with --help for the available parameters. Every combination of the
+parameter values is benchmarked.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import product
+from statistics import median
+from time import perf_counter
+
+BENCHMARKS = (
+    'class_creation',
+    'construct_unbound',
+    'construct_bound',
+    'render',
+    'is_valid',
+    'is_valid_inactive',
+    'add_error',
+    'resolve',
+    'admin_get',
+    'admin_post'
+)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks', description='Benchmarks django-toggled-widgets.'
+    )
+    parser.add_argument(
+        '--groups', type=int, nargs='+', default=[1, 5],
+        help='Numbers of toggle groups per form.'
+    )
+    parser.add_argument(
+        '--members', type=int, nargs='+', default=[2],
+        help='Numbers of toggled fields per group.'
+    )
+    parser.add_argument(
+        '--cohorts', type=int, nargs='+', default=[0, 2],
+        help='Numbers of cohorts per toggled field.'
+    )
+    parser.add_argument(
+        '--field-types', nargs='+', choices=('plain', 'fk'), default=['plain', 'fk'],
+        help='Whether the toggled fields are character fields or foreign keys.'
+    )
+    parser.add_argument(
+        '--inline-rows', type=int, nargs='+', default=[0, 20],
+        help='Numbers of inline rows on the admin change view.'
+    )
+    parser.add_argument(
+        '--skip-inactive', type=int, nargs='+', choices=(0, 1), default=[0],
+        help='Whether forms skip validation of inactive toggled fields (1) or not (0).'
+    )
+    parser.add_argument(
+        '--targets', type=int, default=50,
+        help='Number of objects that toggled foreign keys can point to.'
+    )
+    parser.add_argument(
+        '--rounds', type=int, default=5,
+        help='Number of timed rounds per benchmark; the statistics are taken over these.'
+    )
+    parser.add_argument(
+        '--iterations', type=int, default=50,
+        help='Number of iterations per round for the form benchmarks.'
+    )
+    parser.add_argument(
+        '--admin-iterations', type=int, default=5,
+        help='Number of iterations per round for the admin benchmarks.'
+    )
+    parser.add_argument(
+        '--resolve-batch', type=int, default=1000,
+        help='Number of rows per batch for the resolver benchmark.'
+    )
+    parser.add_argument(
+        '--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+        help='Run only these benchmarks.'
+    )
+    parser.add_argument(
+        '--output', help='Path of the JSON file to write (defaults to standard output).'
+    )
+    return parser.parse_args(argv)
+
+def setup_django():
+    # Allow running from a checkout without installing the package.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+def time_rounds(run, setup, rounds, iterations):
+    """
+    Times the given function over the given number of rounds and returns a
+    dict of per-iteration statistics in microseconds. In each round, setup()
+    is called untimed once per iteration, and run() is then timed with each
+    of the results.
+    """
+    timings = []
+    gc_enabled = gc.isenabled()
+    for i in range(rounds):
+        args = [setup() for j in range(iterations)]
+        gc.disable()
+        try:
+            start = perf_counter()
+            for arg in args:
+                run(arg)
+            timings.append((perf_counter() - start) / iterations * 1e6)
+        finally:
+            if gc_enabled:
+                gc.enable()
+    return {
+        'min_us': round(min(timings), 3),
+        'median_us': round(median(timings), 3),
+        'max_us': round(max(timings), 3),
+        'rounds': rounds,
+        'iterations': iterations
+    }
+
+def measure_memory(run, iterations):
+    """
+    Returns a dict of the memory allocated by the given function, as traced
+    by tracemalloc: the peak amount allocated during a single call, and the
+    amount per call that is still held by the results of the given number of
+    calls.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        results = [run() for i in range(iterations)]
+        retained = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del results
+    return {'peak_bytes': peak, 'retained_bytes': round(retained / iterations)}
+
+def count_queries(run):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as context:
+        run()
+    return len(context.captured_queries)
+
+def populate(built, targets):
+    """
+    Creates the object whose change view is benchmarked, along with its
+    inline rows, and returns it.
+    """
+    scenario = built.scenario
+    values = {}
+    for field_name, g, m, cohorts in scenario.iter_field_names():
+        if not m:
+            if scenario.field_type == 'fk':
+                values[field_name] = targets[g % len(targets)]
+            else:
+                values[field_name] = 'value'
+            for cohort in cohorts:
+                values[cohort] = 'cohort'
+    obj = built.parent_model.objects.create(**values)
+    built.child_model.objects.bulk_create([
+        built.child_model(parent=obj, **values) for i in range(scenario.inline_rows)
+    ])
+    return obj
+
+def get_post_data(built, obj, target):
+    scenario = built.scenario
+    data = scenario.get_field_values(target)
+    children = list(obj.children.order_by('pk')) if scenario.inline_rows else []
+    if scenario.inline_rows:
+        prefix = built.inline_prefix
+        data.update({
+            prefix + '-TOTAL_FORMS': str(len(children)),
+            prefix + '-INITIAL_FORMS': str(len(children)),
+            prefix + '-MIN_NUM_FORMS': '0',
+            prefix + '-MAX_NUM_FORMS': '1000'
+        })
+        row_values = scenario.get_field_values(target)
+        for i, child in enumerate(children):
+            row_prefix = '{}-{}-'.format(prefix, i)
+            data.update({row_prefix + k: v for k, v in row_values.items()})
+            data[row_prefix + 'id'] = str(child.pk)
+            data[row_prefix + 'parent'] = str(obj.pk)
+    data['_save'] = 'Save'
+    return data
+
+def run_scenario(built, args, targets, client):
+    from django.urls import reverse
+    from .scenarios import build_form_class
+    scenario = built.scenario
+    form_class = built.form_class
+    obj = populate(built, targets)
+    data = scenario.get_field_values(targets[0])
+    results = {}
+    if 'class_creation' in args.only:
+        toggle_groups = scenario.get_toggle_groups()
+        model = built.parent_model
+        # The toggle plan is compiled lazily, so include that in the cost of
+        # creating the class.
+        results['class_creation'] = time_rounds(
+            lambda _: build_form_class(model, toggle_groups).get_toggle_plan(),
+            lambda: None, args.rounds, args.iterations
+        )
+    if 'construct_unbound' in args.only:
+        results['construct_unbound'] = time_rounds(
+            lambda _: form_class(instance=obj), lambda: None,
+            args.rounds, args.iterations
+        )
+        results['construct_unbound']['queries'] = count_queries(
+            lambda: form_class(instance=obj)
+        )
+    if 'construct_bound' in args.only:
+        results['construct_bound'] = time_rounds(
+            lambda _: form_class(data, instance=obj), lambda: None,
+            args.rounds, args.iterations
+        )
+    if 'render' in args.only:
+        results['render'] = time_rounds(
+            str, lambda: form_class(instance=obj), args.rounds, args.iterations
+        )
+        results['render']['queries'] = count_queries(lambda: str(form_class(instance=obj)))
+        results['render']['bytes'] = len(str(form_class(instance=obj)))
+        # The per-widget figures include the metafields.
+        widgets = len(form_class.base_fields)
+        results['render']['widgets'] = widgets
+        results['render']['median_us_per_widget'] = round(
+            results['render']['median_us'] / widgets, 3
+        )
+        def rendered_form():
+            form = form_class(instance=obj)
+            str(form)
+            return form
+        memory = measure_memory(rendered_form, args.iterations)
+        memory['retained_bytes_per_widget'] = round(memory['retained_bytes'] / widgets)
+        results['render'].update(memory)
+    if 'is_valid' in args.only:
+        def check(form):
+            if not form.is_valid():
+                raise AssertionError('{}: {}'.format(scenario.label, form.errors.as_json()))
+        results['is_valid'] = time_rounds(
+            check, lambda: form_class(data, instance=obj), args.rounds, args.iterations
+        )
+        results['is_valid']['queries'] = count_queries(
+            lambda: form_class(data, instance=obj).is_valid()
+        )
+    if 'is_valid_inactive' in args.only:
+        # Every toggled field has a value, and those of the inactive ones are
+        # costly to validate, so this shows what skip_inactive_validation
+        # saves.
+        validated_form_class = built.validated_form_class
+        filled_data = scenario.get_field_values(targets[0], fill_inactive=True)
+        def check_filled(form):
+            if not form.is_valid():
+                raise AssertionError('{}: {}'.format(scenario.label, form.errors.as_json()))
+        results['is_valid_inactive'] = time_rounds(
+            check_filled, lambda: validated_form_class(filled_data, instance=obj),
+            args.rounds, args.iterations
+        )
+        results['is_valid_inactive']['queries'] = count_queries(
+            lambda: validated_form_class(filled_data, instance=obj).is_valid()
+        )
+    if 'add_error' in args.only:
+        # Flag every toggled field and cohort after validation, as a clean()
+        # method rejecting everything would, which reveals each member of
+        # every group in turn.
+        field_names = [
+            name for field_name, g, m, cohorts in scenario.iter_field_names()
+            for name in [field_name] + cohorts
+        ]
+        def validated_form():
+            form = form_class(data, instance=obj)
+            form.is_valid()
+            return form
+        def add_errors(form):
+            for field_name in field_names:
+                form.add_error(field_name, 'Invalid.')
+        results['add_error'] = time_rounds(
+            add_errors, validated_form, args.rounds, args.iterations
+        )
+        results['add_error']['errors'] = len(field_names)
+    if 'resolve' in args.only:
+        resolver = form_class.get_toggle_resolver()
+        # Alternate the active members, and leave out the metafields from
+        # every other row so that inference is measured too.
+        metafield_names = set(resolver.get_active_members(data))
+        rows = [
+            data if i % 2 else {k: v for k, v in data.items() if k not in metafield_names}
+            for i in range(args.resolve_batch)
+        ]
+        results['resolve'] = time_rounds(
+            resolver.resolve_batch, lambda: rows, args.rounds, args.iterations
+        )
+        results['resolve']['batch'] = args.resolve_batch
+        results['resolve']['rows_per_second'] = round(
+            args.resolve_batch / results['resolve']['median_us'] * 1e6
+        )
+    url = reverse(
+        'benchmarks:{}_{}_change'.format(obj._meta.app_label, obj._meta.model_name),
+        args=(obj.pk,)
+    )
+    if 'admin_get' in args.only:
+        def get(_):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise AssertionError('{}: GET returned {}'.format(scenario.label, response.status_code))
+        results['admin_get'] = time_rounds(
+            get, lambda: None, args.rounds, args.admin_iterations
+        )
+        results['admin_get']['queries'] = count_queries(lambda: get(None))
+        results['admin_get']['bytes'] = len(client.get(url).content)
+    if 'admin_post' in args.only:
+        post_data = get_post_data(built, obj, targets[0])
+        def post(_):
+            response = client.post(url, post_data)
+            if response.status_code != 302:
+                raise AssertionError('{}: POST returned {}: {}'.format(
+                    scenario.label, response.status_code,
+                    getattr(response, 'context_data', {}).get('errors')
+                ))
+        results['admin_post'] = time_rounds(
+            post, lambda: None, args.rounds, args.admin_iterations
+        )
+        results['admin_post']['queries'] = count_queries(lambda: post(None))
+    return results
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_django()
+    import django
+    from django.contrib.auth import get_user_model
+    from django.test import Client
+    from .scenarios import Scenario, Target, build_scenario
+    from django.db import connection
+    with connection.schema_editor() as editor:
+        editor.create_model(Target)
+    targets = Target.objects.bulk_create([
+        Target(name='Target {}'.format(i)) for i in range(args.targets)
+    ])
+    # Everything has to be registered with the admin site before the URLconf
+    # is loaded.
+    built_scenarios = [
+        build_scenario(Scenario(*values)) for values in product(
+            args.groups, args.members, args.cohorts, args.field_types, args.inline_rows,
+            args.skip_inactive
+        )
+    ]
+    user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+    client = Client()
+    client.force_login(user)
+    results = []
+    for built in built_scenarios:
+        print('Benchmarking {}'.format(built.scenario.label), file=sys.stderr)
+        results.append({
+            'scenario': dict(built.scenario._asdict(), label=built.scenario.label),
+            'benchmarks': run_scenario(built, args, targets, client)
+        })
+    output = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'arguments': vars(args)
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
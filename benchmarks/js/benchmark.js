@@ -0,0 +1,197 @@
+/* Headless benchmark of the client side. It loads an admin change view
+rendered by "python -m benchmarks.page" into jsdom, along with jQuery and the
+package's scripts, and times the scripts' initialization, a first toggle of
+every metafield (which may be when the forms are set up) and a second toggle
+back. From this directory, after "npm install":
+
+    node benchmark.js page.html --rounds 5
+
+Pass --static to load the package's scripts from another static directory,
+e.g. that of an older release along with a page rendered by that release, to
+compare the two. The results are written to standard output as JSON. */
+'use strict';
+const childProcess = require('child_process');
+const fs = require('fs');
+const path = require('path');
+const {performance} = require('perf_hooks');
+const {JSDOM} = require('jsdom');
+
+const USAGE = 'Usage: node benchmark.js PAGE [--rounds N] [--static DIR] ' +
+    '[--django-static DIR] [--python PATH]';
+
+function parseArgs(argv) {
+    let args = {
+        page: null,
+        rounds: 5,
+        staticRoot: path.join(__dirname, '..', '..', 'src', 'toggled_widgets', 'static'),
+        djangoStaticRoot: null,
+        python: 'python'
+    };
+    for (let i = 0; i < argv.length; i++) {
+        switch (argv[i]) {
+            case '--rounds':
+                args.rounds = parseInt(argv[++i], 10);
+                break;
+            case '--static':
+                args.staticRoot = argv[++i];
+                break;
+            case '--django-static':
+                args.djangoStaticRoot = argv[++i];
+                break;
+            case '--python':
+                args.python = argv[++i];
+                break;
+            default:
+                if (args.page !== null || argv[i].indexOf('--') === 0) {
+                    throw new Error(USAGE);
+                }
+                args.page = argv[i];
+        }
+    }
+    if (args.page === null || !(args.rounds > 0)) {
+        throw new Error(USAGE);
+    }
+    if (args.djangoStaticRoot === null) {
+        // jQuery and its initialization come from the admin's static files.
+        args.djangoStaticRoot = childProcess.execFileSync(args.python, ['-c',
+            'import os, django.contrib.admin as admin; ' +
+            'print(os.path.join(os.path.dirname(admin.__file__), "static"))'
+        ], {encoding: 'utf8'}).trim();
+    }
+    return args;
+}
+
+/* Returns the scripts that the page includes that should be evaluated, in
+order: jQuery and its initialization, which aren't timed, and the package's
+own scripts, which are. The admin's other scripts are left out so that they
+don't add noise. */
+function getScripts(html, args) {
+    let document = new JSDOM(html).window.document;
+    let elements = document.querySelectorAll('script[src]');
+    let scripts = [];
+    for (let i = 0; i < elements.length; i++) {
+        let src = elements[i].getAttribute('src').split('?')[0];
+        if (src.indexOf('/static/') !== 0) {
+            continue;
+        }
+        src = src.slice('/static/'.length);
+        let packagePath = path.join(args.staticRoot, src);
+        if (fs.existsSync(packagePath)) {
+            scripts.push({src: src, timed: true, source: fs.readFileSync(packagePath, 'utf8')});
+        } else if (/(^|\/)jquery(\.min)?\.js$|(^|\/)jquery\.init\.js$/.test(src)) {
+            scripts.push({
+                src: src,
+                timed: false,
+                source: fs.readFileSync(path.join(args.djangoStaticRoot, src), 'utf8')
+            });
+        }
+    }
+    if (!scripts.some(function(script) { return script.timed; })) {
+        throw new Error('The page includes none of the scripts in ' + args.staticRoot + '.');
+    }
+    return scripts;
+}
+
+/* Toggles each of the given metafields, which dispatches the event that the
+scripts listen for, and returns the duration in milliseconds. */
+function toggleAll(window, metafields) {
+    let start = performance.now();
+    for (let i = 0; i < metafields.length; i++) {
+        let metafield = metafields[i];
+        metafield.selectedIndex = metafield.selectedIndex ? 0 : 1;
+        metafield.dispatchEvent(new window.Event('change', {bubbles: true}));
+    }
+    return performance.now() - start;
+}
+
+/* Throws an error unless the row of the field selected by each of the given
+metafields is visible. */
+function checkVisibility(window, metafields) {
+    for (let i = 0; i < metafields.length; i++) {
+        let metafield = metafields[i];
+        let prefix = metafield.name.slice(0, metafield.name.lastIndexOf('-') + 1);
+        let element = window.document.getElementsByName(prefix + metafield.value)[0];
+        let row = element && element.closest('.form-row');
+        if (!row || row.classList.contains('hidden')) {
+            throw new Error('Toggling ' + metafield.name + ' did not show ' + prefix + metafield.value + '.');
+        }
+    }
+}
+
+async function runRound(html, scripts) {
+    let window = new JSDOM(html, {runScripts: 'outside-only'}).window;
+    let start = null;
+    for (let i = 0; i < scripts.length; i++) {
+        if (scripts[i].timed && start === null) {
+            start = performance.now();
+        }
+        window.eval(scripts[i].source);
+    }
+    /* Ready handlers run in the order in which they were added, so this runs
+    once those of the package's scripts have. This includes the hop through the
+    event loop that jQuery takes before running them, which costs the same for
+    any version of the scripts. */
+    await new Promise(function(resolve) {
+        window.django.jQuery(resolve);
+    });
+    let initialize = performance.now() - start;
+    let metafields = Array.prototype.filter.call(
+        window.document.querySelectorAll('select.toggle-metafield'),
+        function(metafield) {
+            return metafield.name.indexOf('__prefix__') === -1;
+        }
+    );
+    let firstToggle = toggleAll(window, metafields);
+    checkVisibility(window, metafields);
+    let secondToggle = toggleAll(window, metafields);
+    checkVisibility(window, metafields);
+    window.close();
+    return {
+        metafields: metafields.length,
+        initialize: initialize,
+        first_toggle: firstToggle,
+        second_toggle: secondToggle
+    };
+}
+
+function summarize(timings) {
+    let sorted = timings.slice().sort(function(a, b) { return a - b; });
+    let middle = Math.floor(sorted.length / 2);
+    let median = sorted.length % 2 ? sorted[middle] : (sorted[middle - 1] + sorted[middle]) / 2;
+    let round = function(value) { return Math.round(value * 1000) / 1000; };
+    return {
+        min_ms: round(sorted[0]),
+        median_ms: round(median),
+        max_ms: round(sorted[sorted.length - 1]),
+        rounds: sorted.length
+    };
+}
+
+async function main() {
+    let args = parseArgs(process.argv.slice(2));
+    let html = fs.readFileSync(args.page, 'utf8');
+    let scripts = getScripts(html, args);
+    let rounds = [];
+    for (let i = 0; i < args.rounds; i++) {
+        rounds.push(await runRound(html, scripts));
+    }
+    let results = {metafields: rounds[0].metafields};
+    for (let name of ['initialize', 'first_toggle', 'second_toggle']) {
+        results[name] = summarize(rounds.map(function(round) { return round[name]; }));
+    }
+    process.stdout.write(JSON.stringify({
+        meta: {
+            timestamp: new Date().toISOString(),
+            node: process.version,
+            page: path.resolve(args.page),
+            static: path.resolve(args.staticRoot),
+            scripts: scripts.map(function(script) { return script.src; })
+        },
+        results: results
+    }, null, 2) + '\n');
+}
+
+main().catch(function(error) {
+    process.stderr.write(error.stack + '\n');
+    process.exit(1);
+});
@@ -0,0 +1,83 @@
+"""
+Renders the admin change view of a single benchmark scenario and writes the
+HTML, for the headless benchmark of the client side in benchmarks/js. From the
+root of the repository:
+
+    python -m benchmarks.page --inline-rows 1000 --output page.html
+
+The inline is stacked by default, since each of its fields is then in a row of
+its own that can be shown and hidden.
+"""
+import argparse
+import sys
+from .__main__ import populate, setup_django
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.page',
+        description='Renders an admin change view for the JavaScript benchmark.'
+    )
+    parser.add_argument('--groups', type=int, default=2, help='Number of toggle groups.')
+    parser.add_argument(
+        '--members', type=int, default=2, help='Number of toggled fields per group.'
+    )
+    parser.add_argument(
+        '--cohorts', type=int, default=1, help='Number of cohorts per toggled field.'
+    )
+    parser.add_argument(
+        '--field-type', choices=('plain', 'fk'), default='plain',
+        help='Whether the toggled fields are character fields or foreign keys.'
+    )
+    parser.add_argument(
+        '--inline-rows', type=int, default=1000, help='Number of inline rows.'
+    )
+    parser.add_argument(
+        '--tabular', action='store_true', help='Use a tabular rather than a stacked inline.'
+    )
+    parser.add_argument(
+        '--targets', type=int, default=50,
+        help='Number of objects that toggled foreign keys can point to.'
+    )
+    parser.add_argument(
+        '--output', help='Path of the HTML file to write (defaults to standard output).'
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_django()
+    from django.contrib import admin
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.urls import reverse
+    from .scenarios import Scenario, Target, build_scenario
+    with connection.schema_editor() as editor:
+        editor.create_model(Target)
+    targets = Target.objects.bulk_create([
+        Target(name='Target {}'.format(i)) for i in range(args.targets)
+    ])
+    built = build_scenario(
+        Scenario(
+            args.groups, args.members, args.cohorts, args.field_type, args.inline_rows, 0
+        ),
+        admin.TabularInline if args.tabular else admin.StackedInline
+    )
+    obj = populate(built, targets)
+    user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+    client = Client()
+    client.force_login(user)
+    response = client.get(reverse(
+        'benchmarks:{}_{}_change'.format(obj._meta.app_label, obj._meta.model_name),
+        args=(obj.pk,)
+    ))
+    if response.status_code != 200:
+        raise AssertionError('GET returned {}'.format(response.status_code))
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(response.content)
+    else:
+        sys.stdout.buffer.write(response.content)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Builds the synthetic models, forms and model admin classes that the
+benchmarks exercise. Each scenario gets its own pair of models (a parent and
+an inline child with the same toggled fields), since the shape of the toggle
+groups is part of the model definition.
+"""
+from collections import namedtuple
+from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.db import connection, models
+from django.forms import ModelForm
+from toggled_widgets import (
+    ToggledWidgetAdminMixin, ToggledWidgetFormMixin, ToggledWidgetModelFormMetaclass
+)
+
+APP_LABEL = 'benchmarks'
+
+site = admin.AdminSite(name='benchmarks')
+
+class Target(models.Model):
+    """
+    Model that toggled foreign keys point to.
+    """
+    name = models.CharField(max_length=50)
+
+    class Meta:
+        app_label = APP_LABEL
+
+    def __str__(self):
+        return self.name
+
+def validate_unused_name(value):
+    """
+    Validator for toggled character fields that costs a query, as lookups of
+    related or unique values do.
+    """
+    if Target.objects.filter(name=value).exists():
+        raise ValidationError('This name is already used by a target.')
+
+class Scenario(namedtuple('Scenario', (
+    'groups', 'members', 'cohorts', 'field_type', 'inline_rows', 'skip_inactive'
+))):
+    """
+    Describes the shape of a benchmarked form: the number of toggle groups,
+    the number of toggled fields in each, the number of cohorts per toggled
+    field, whether the toggled fields are foreign keys ("fk") or character
+    fields ("plain"), the number of inline rows on the admin change view, and
+    whether the form skips validation of inactive fields.
+    """
+    @property
+    def label(self):
+        return 'g{}_m{}_c{}_{}_i{}_s{}'.format(*self)
+
+    def get_toggle_groups(self):
+        """
+        Returns the value of the toggle_groups attribute for forms of this
+        scenario.
+        """
+        return [
+            tuple(
+                ('g{}m{}'.format(g, m),) + tuple(
+                    'g{}m{}c{}'.format(g, m, c) for c in range(self.cohorts)
+                ) if self.cohorts else 'g{}m{}'.format(g, m)
+                for m in range(self.members)
+            ) for g in range(self.groups)
+        ]
+
+    def iter_field_names(self):
+        """
+        Yields tuples of each toggled field name, its group index and member
+        index, and the names of its cohorts.
+        """
+        for g in range(self.groups):
+            for m in range(self.members):
+                yield 'g{}m{}'.format(g, m), g, m, [
+                    'g{}m{}c{}'.format(g, m, c) for c in range(self.cohorts)
+                ]
+
+    def build_model_fields(self):
+        fields = {}
+        for field_name, g, m, cohorts in self.iter_field_names():
+            if self.field_type == 'fk':
+                fields[field_name] = models.ForeignKey(
+                    Target, null=True, blank=True, on_delete=models.SET_NULL,
+                    related_name='+'
+                )
+            else:
+                fields[field_name] = models.CharField(max_length=50, blank=True)
+            for cohort in cohorts:
+                fields[cohort] = models.CharField(max_length=50, blank=True)
+        return fields
+
+    def get_field_values(self, target, fill_inactive=False):
+        """
+        Returns a dict of form data in which the first toggled field of each
+        group is active and has a value. If fill_inactive is true, the other
+        toggled fields and their cohorts have values too, as they do when a
+        user fills in a field and then toggles away from it.
+        """
+        data = {}
+        for field_name, g, m, cohorts in self.iter_field_names():
+            if m and not fill_inactive:
+                value = ''
+            elif self.field_type == 'fk':
+                value = str(target.pk)
+            else:
+                value = 'value' if not m else 'stale'
+            data[field_name] = value
+            for cohort in cohorts:
+                data[cohort] = 'cohort' if not m or fill_inactive else ''
+            if not m:
+                data[ToggledWidgetModelFormMetaclass.get_metafield_name(field_name)] = field_name
+        return data
+
+BuiltScenario = namedtuple('BuiltScenario', (
+    'scenario', 'parent_model', 'child_model', 'form_class', 'child_form_class',
+    'validated_form_class', 'model_admin', 'inline_prefix'
+))
+
+def build_model(name, attrs):
+    attrs.update({
+        '__module__': __name__,
+        'Meta': type('Meta', (), {'app_label': APP_LABEL})
+    })
+    return type(name, (models.Model,), attrs)
+
+def build_form_class(model, toggle_groups, name=None, **attrs):
+    """
+    Returns a new toggled ModelForm class for the given model, with the given
+    additional class attributes. This is what the class creation benchmark
+    measures.
+    """
+    meta = type('Meta', (), {'model': model, 'fields': '__all__'})
+    attrs.update({'toggle_groups': toggle_groups, 'Meta': meta, '__module__': __name__})
+    return type(name or model.__name__ + 'Form', (ToggledWidgetFormMixin, ModelForm), attrs)
+
+def build_validated_form_class(scenario, model, toggle_groups, **attrs):
+    """
+    Returns a new toggled ModelForm class for the given model whose toggled
+    character fields have a validator that costs a query. (Toggled foreign
+    keys cost a query to clean anyway.)
+    """
+    form_class = build_form_class(
+        model, toggle_groups, model.__name__ + 'ValidatedForm', **attrs
+    )
+    if scenario.field_type == 'plain':
+        for field_name, g, m, cohorts in scenario.iter_field_names():
+            form_class.base_fields[field_name].validators.append(validate_unused_name)
+    return form_class
+
+def build_scenario(scenario, inline_class=admin.TabularInline):
+    """
+    Creates the models, tables, forms and admin classes for the given
+    Scenario and returns a BuiltScenario. The inline uses the given base
+    class.
+    """
+    toggle_groups = scenario.get_toggle_groups()
+    name = scenario.label.title().replace('_', '')
+    parent_model = build_model('Parent' + name, scenario.build_model_fields())
+    child_attrs = scenario.build_model_fields()
+    child_attrs['parent'] = models.ForeignKey(
+        parent_model, on_delete=models.CASCADE, related_name='children'
+    )
+    child_model = build_model('Child' + name, child_attrs)
+    with connection.schema_editor() as editor:
+        editor.create_model(parent_model)
+        editor.create_model(child_model)
+    form_attrs = {'skip_inactive_validation': bool(scenario.skip_inactive)}
+    form_class = build_form_class(parent_model, toggle_groups, **form_attrs)
+    child_form_class = build_form_class(child_model, toggle_groups, **form_attrs)
+    validated_form_class = build_validated_form_class(
+        scenario, parent_model, toggle_groups, **form_attrs
+    )
+    inline_class = type(name + 'Inline', (ToggledWidgetAdminMixin, inline_class), {
+        'model': child_model,
+        'form': child_form_class,
+        'extra': 0
+    })
+    admin_class = type(name + 'Admin', (ToggledWidgetAdminMixin, admin.ModelAdmin), {
+        'form': form_class,
+        'inlines': [inline_class] if scenario.inline_rows else []
+    })
+    site.register(parent_model, admin_class)
+    return BuiltScenario(
+        scenario, parent_model, child_model, form_class, child_form_class,
+        validated_form_class, site._registry[parent_model], 'children'
+    )
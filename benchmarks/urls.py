@@ -0,0 +1,4 @@
+from django.urls import path
+from .scenarios import site
+
+urlpatterns = [path('admin/', site.urls)]
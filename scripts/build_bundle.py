@@ -0,0 +1,69 @@
+"""
+Builds the minified, content-hashed static files used when the
+TOGGLED_WIDGETS_BUNDLED_MEDIA setting is true, removes any previous builds, and
+writes their names to src/toggled_widgets/bundle.py. Run this from the root of
+the repository whenever the scripts or the stylesheet change:
+
+    python scripts/build_bundle.py
+
+This requires the rjsmin package.
+"""
+import hashlib
+import os
+import re
+from rjsmin import jsmin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.join(ROOT, 'src', 'toggled_widgets')
+STATIC = os.path.join(PACKAGE, 'static')
+# The scripts to bundle, in order
+SCRIPTS = ('admin/js/ToggledWidget.js', 'admin/js/ToggledWidget.init.js')
+STYLESHEET = 'admin/css/ToggledWidget.css'
+
+def read(path):
+    with open(os.path.join(STATIC, path), encoding='utf-8') as f:
+        return f.read()
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};:,])\s*', r'\1', css).replace(';}', '}').strip() + '\n'
+
+def write_hashed(path_pattern, content, glob_pattern):
+    """
+    Writes the given content to the static path given by the pattern, with
+    the content hash substituted for "{}", after removing any existing files
+    matching the given regular expression in the same directory. Returns the
+    static path.
+    """
+    path = path_pattern.format(hashlib.sha256(content.encode('utf-8')).hexdigest()[:12])
+    directory = os.path.dirname(os.path.join(STATIC, path))
+    for name in os.listdir(directory):
+        if re.fullmatch(glob_pattern, name):
+            os.remove(os.path.join(directory, name))
+    with open(os.path.join(STATIC, path), 'w', encoding='utf-8') as f:
+        f.write(content)
+    return path
+
+def main():
+    js = write_hashed(
+        'admin/js/ToggledWidget.bundle.{}.min.js',
+        ';\n'.join(jsmin(read(path)).strip().rstrip(';') for path in SCRIPTS) + ';\n',
+        r'ToggledWidget\.bundle\.[0-9a-f]+\.min\.js'
+    )
+    css = write_hashed(
+        'admin/css/ToggledWidget.bundle.{}.min.css',
+        minify_css(read(STYLESHEET)),
+        r'ToggledWidget\.bundle\.[0-9a-f]+\.min\.css'
+    )
+    with open(os.path.join(PACKAGE, 'bundle.py'), 'w', encoding='utf-8') as f:
+        f.write(
+            '# Generated by scripts/build_bundle.py; do not edit.\n'
+            'JS = {!r}\n'
+            'CSS = {!r}\n'.format(js, css)
+        )
+    print(js)
+    print(css)
+
+if __name__ == '__main__':
+    main()
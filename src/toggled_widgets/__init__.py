@@ -1,34 +1,219 @@
-import sys
+import json
+import logging
+from collections import namedtuple
+from contextlib import ExitStack
 from copy import deepcopy
-from itertools import chain
+from functools import wraps
+from threading import RLock
+from itertools import chain, count
+from time import perf_counter
+from types import MappingProxyType
+from urllib.parse import quote as quote_query_value
 from warnings import warn
+from django.conf import settings
+from django.contrib.admin.options import InlineModelAdmin, ModelAdmin
+from django.contrib.admin.utils import quote, unquote
 from django.contrib.admin.widgets import RelatedFieldWidgetWrapper
-from django.core.exceptions import ImproperlyConfigured
-from django.forms import ChoiceField
+from django.core.exceptions import (
+    FieldDoesNotExist, ImproperlyConfigured, PermissionDenied, ValidationError
+)
+from django.core.validators import EMPTY_VALUES
+from django.db import connections
+from django.forms import ChoiceField, FileField
 from django.forms.boundfield import BoundField
-from django.forms.models import ModelFormMetaclass
+from django.forms.models import (
+    BaseModelFormSet, ModelChoiceField, ModelChoiceIterator, ModelFormMetaclass,
+    model_to_dict
+)
 from django.forms.utils import pretty_name
 from django.forms.widgets import Media, Widget, ChoiceWidget, Select, HiddenInput
+from django.http import Http404, JsonResponse
+from django.urls import NoReverseMatch, path, reverse
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from . import bundle
+
+_JSON_SCRIPT_ESCAPES = {
+    ord('>'): '\\u003E',
+    ord('<'): '\\u003C',
+    ord('&'): '\\u0026'
+}
+
+# Guards the lazily computed, per-class toggle state
+_toggle_class_lock = RLock()
 
 class SetupIncompleteError(ImproperlyConfigured):
     pass
 
+class ToggleCollector:
+    """
+    Base class for receivers of instrumentation data. Install an instance with
+    set_toggle_collector() to have the duration of each instrumented step
+    reported to its record() method, along with a dict of counts describing
+    the work that was done. When no collector is installed, the only overhead
+    is a check of a module-level variable.
+    """
+    # If this is true, the database queries executed during each step are
+    # counted and reported as the "queries" count.
+    count_queries = False
+
+    def record(self, event, form_class, duration, counts):
+        """
+        Receives the name of the step (e.g. "setup" or "get_fields"), the
+        form class involved, the step's duration in seconds, and the dict of
+        counts. This implementation does nothing.
+        """
+
+    @staticmethod
+    def get_form_label(form_class):
+        return '{}.{}'.format(form_class.__module__, form_class.__qualname__)
+
+class LoggingToggleCollector(ToggleCollector):
+    """
+    Collector that writes a log record for each instrumented step.
+    """
+    def __init__(self, logger=None, level=logging.DEBUG, count_queries=False):
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+        self.count_queries = count_queries
+
+    def record(self, event, form_class, duration, counts):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(
+                self.level, '%s %s %.3fms %s', self.get_form_label(form_class),
+                event, duration * 1000,
+                ' '.join('{}={}'.format(k, v) for k, v in counts.items())
+            )
+
+class StatsdToggleCollector(ToggleCollector):
+    """
+    Collector that reports to a client with the interface of the "statsd"
+    package's StatsClient (i.e. timing() and incr() methods). Each step is
+    reported as a timing in milliseconds, and each count is added to a
+    counter, along with a counter of calls, so that averages can be derived.
+    """
+    def __init__(self, client, prefix='toggled_widgets', count_queries=False):
+        self.client = client
+        self.prefix = prefix
+        self.count_queries = count_queries
+
+    def record(self, event, form_class, duration, counts):
+        stat = '{}.{}.{}'.format(
+            self.prefix, self.get_form_label(form_class).replace('.', '_'), event
+        )
+        self.client.timing(stat, duration * 1000)
+        self.client.incr(stat + '.calls')
+        for name, value in counts.items():
+            self.client.incr('{}.{}'.format(stat, name), value)
+
+_toggle_collector = None
+
+def set_toggle_collector(collector):
+    """
+    Installs the given ToggleCollector instance (or None to disable the
+    instrumentation) and returns the previously installed one.
+    """
+    global _toggle_collector
+    previous = _toggle_collector
+    _toggle_collector = collector
+    return previous
+
+def get_toggle_collector():
+    return _toggle_collector
+
+def _instrumented(event, get_counts, get_form_class=type):
+    """
+    Decorator for methods that should be reported to the installed collector.
+    get_counts is called with the instance and the method's return value and
+    should return a dict of counts; get_form_class is called with the
+    instance and should return the form class to report.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            collector = _toggle_collector
+            if collector is None:
+                return method(self, *args, **kwargs)
+            query_count = [0]
+            with ExitStack() as stack:
+                if collector.count_queries:
+                    def count_query(execute, *query_args):
+                        query_count[0] += 1
+                        return execute(*query_args)
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(count_query))
+                start = perf_counter()
+                result = method(self, *args, **kwargs)
+                duration = perf_counter() - start
+            counts = get_counts(self, result)
+            if collector.count_queries:
+                counts['queries'] = query_count[0]
+            collector.record(event, get_form_class(self), duration, counts)
+            return result
+        return wrapper
+    return decorator
+
+def _count_toggle_plan(form, result):
+    plan = form.get_toggle_plan()
+    return {
+        'groups': len(plan.groups),
+        'widgets': sum(len(g.members) for g in plan.groups),
+        'cohorts': len(plan.cohort_fields_index)
+    }
+
 class MetafieldWidget(Select):
     """
     Widget that renders itself as a toggling button if there are only two
     total options and as a <select> element otherwise.
     """
+    # If this is true, the rendered HTML is cached and reused by every copy of
+    # the widget (i.e. by every instance of the form, including each form in a
+    # formset), since the options are fixed per form class. Set it to false if
+    # a subclass' rendering depends on anything other than the name, value,
+    # attributes, choices, renderer and active language.
+    cache_renders = True
+    # The maximum number of renders to cache. Only values that are among the
+    # choices are cached, so this only guards against attributes that vary
+    # more than expected.
+    render_cache_size = 128
+    # Placeholders for the name and ID in cached HTML
+    _NAME_PLACEHOLDER = '__toggle_metafield_name__'
+    _ID_PLACEHOLDER = '__toggle_metafield_id__'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.option_count = 0
+        # Copies of this widget share this with it.
+        self._render_cache = {}
 
-    def create_option(self, *args, **kwargs):
-        self.option_count += 1
-        return super().create_option(*args, **kwargs)
+    def is_toggle_button(self):
+        """
+        Returns whether the widget should be rendered as a toggling button,
+        i.e. whether there are exactly two options.
+        """
+        option_count = 0
+        for value, label in self.choices:
+            option_count += len(label) if isinstance(label, (list, tuple)) else 1
+            if option_count > 2:
+                return False
+        return option_count == 2
+
+    def _get_choice_values(self):
+        """
+        Returns a set of the formatted values of the choices, along with the
+        empty value.
+        """
+        values = {''}
+        for value, label in self.choices:
+            if isinstance(label, (list, tuple)):
+                values.update(str(v) for v, l in label)
+            else:
+                values.add(str(value))
+        return values
 
     def get_context(self, *args, **kwargs):
         context = super().get_context(*args, **kwargs)
-        if self.option_count == 2:
+        if self.is_toggle_button():
             attrs = context['widget']['attrs']
             try:
                 attrs['class'] += ' toggle-button'
@@ -36,11 +221,62 @@ class MetafieldWidget(Select):
                 attrs['class'] = 'toggle-button'
         return context
 
+    def render(self, name, value, attrs=None, renderer=None):
+        if not self.cache_renders:
+            return super().render(name, value, attrs, renderer)
+        attrs = dict(attrs or ())
+        id_ = attrs.pop('id', None)
+        try:
+            key = (
+                tuple(self.format_value(value)), tuple(sorted(attrs.items())),
+                tuple(sorted(self.attrs.items())), tuple(self.choices), renderer,
+                get_language()
+            )
+            html = self._render_cache[key]
+        except TypeError:
+            # Something unhashable; don't bother caching.
+            html = None
+        except KeyError:
+            # Submitted values can be anything, so only cache those that are
+            # among the choices.
+            if len(self._render_cache) < self.render_cache_size and \
+                    self._get_choice_values().issuperset(key[0]):
+                if id_:
+                    attrs['id'] = self._ID_PLACEHOLDER
+                html = self._render_cache[key] = super().render(
+                    self._NAME_PLACEHOLDER, value, attrs, renderer
+                )
+            else:
+                html = None
+        if html is None:
+            if id_:
+                attrs['id'] = id_
+            return super().render(name, value, attrs, renderer)
+        html = html.replace(self._NAME_PLACEHOLDER, conditional_escape(name))
+        if id_:
+            html = html.replace(self._ID_PLACEHOLDER, conditional_escape(id_))
+        return mark_safe(html)
+
 class LabellessBoundField(BoundField):
     def label_tag(self, *args, **kwargs):
         return ''
 
+    def as_widget(self, *args, **kwargs):
+        html = super().as_widget(*args, **kwargs)
+        # Each group's toggle manifest rides along with its metafield, since
+        # there's no form-level hook for rendering it.
+        if isinstance(self.form, ToggledWidgetFormMixin):
+            html += self.form.render_toggle_manifest(self.name)
+        return html
+
 class Metafield(ChoiceField):
+    def __deepcopy__(self, memo):
+        # The choices are determined by the form class and never modified in
+        # place, so there's no need to copy them for each form.
+        result = super(ChoiceField, self).__deepcopy__(memo)
+        result._choices = self._choices
+        return result
+
     def get_bound_field(self, form, field_name):
         return LabellessBoundField(form, self, field_name)
 
@@ -72,55 +308,235 @@ class ToggledWidgetMixin:
         """
         return self.metafield_label
 
+class ToggleDeferral(namedtuple('ToggleDeferral', ('prefix', 'source_prefix', 'source_names'))):
+    """
+    Describes how the hidden toggled widgets of a form with the given prefix
+    are deferred. Each one is rendered as a <template> element that the
+    client side replaces with the widget when it is first shown. If
+    source_prefix is None, the template contains the widget; otherwise, the
+    templates of widgets with empty values are left empty and refer to the
+    equivalent widgets of the form with that prefix (i.e. the formset's empty
+    form), which that form renders once as sources. That only applies to the
+    fields in the source_names set, whose values in that form are empty too.
+    """
+    def get_source_name(self, name):
+        if self.source_prefix is None or self.prefix is None or \
+                not name.startswith(self.prefix + '-') or \
+                name[len(self.prefix) + 1:] not in self.source_names:
+            return None
+        return self.source_prefix + name[len(self.prefix):]
+
+    def render(self, wrapper, name, value, attrs=None, renderer=None):
+        source_name = self.get_source_name(name)
+        if source_name is not None and value in EMPTY_VALUES:
+            return format_html(
+                '<template class="toggle-deferred" name="{}" data-toggle-source="{}"></template>',
+                name, source_name
+            )
+        return format_html(
+            '<template class="toggle-deferred" name="{}">{}</template>',
+            name, wrapper.render_widget(name, value, attrs, renderer)
+        )
+
+    @staticmethod
+    def render_source(bound_field):
+        """
+        Renders the given bound field's widget, without the toggling wrapper,
+        inside a <template> element that deferred widgets can refer to.
+        """
+        return format_html(
+            '<template class="toggle-source" data-toggle-name="{}">{}</template>',
+            bound_field.html_name,
+            bound_field.as_widget(widget=bound_field.field.widget.widget)
+        )
+
+# Whether the media of each widget class includes scripts
+_widget_scripts_index = {}
+
+def _has_widget_scripts(widget):
+    """
+    Returns whether the given widget's media includes scripts, which (as with
+    the admin's date and autocomplete widgets) may set the widget up when the
+    page loads.
+    """
+    widget_class = type(widget)
+    try:
+        return _widget_scripts_index[widget_class]
+    except KeyError:
+        has_scripts = _widget_scripts_index[widget_class] = bool(widget.media._js)
+        return has_scripts
+
+class ToggleGroupState:
+    """
+    Visibility state shared by the ToggledWidgetWrapper instances of a single
+    toggle group within a form. Storing the active member in one place makes
+    toggling and visibility checks constant-time, however large the group is.
+    """
+    __slots__ = ('active',)
+
+    def __init__(self):
+        # The member that was last made visible, or None if none has been,
+        # in which case every member is visible unless hidden individually
+        self.active = None
+
 class ToggledWidgetCohortWrapper:
     """
     Wrapper class for cohorts of widgets that control a toggling relationship.
     """
+    __slots__ = ('widget', '_is_hidden', 'attrs', 'deferral', 'master')
     _UNDELEGATED_ATTRIBUTES = (
         'widget',
         'is_hidden',
         '_is_hidden',
         '_set_visibility',
-        'attrs'
+        'attrs',
+        'deferral',
+        'master'
     )
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._undelegated_attributes = frozenset(cls._UNDELEGATED_ATTRIBUTES)
+
     def __init__(self, widget):
-        self.widget = widget
-        self._is_hidden = False
+        set_attribute = object.__setattr__
+        set_attribute(self, 'widget', widget)
+        set_attribute(self, '_is_hidden', False)
         # Widgets for choice fields in the admin are wrapped in a container,
         # which means that in order to set HTML attributes on them, you have
         # to drill down.
-        self.attrs = widget.widget.attrs if isinstance(widget, RelatedFieldWidgetWrapper) else widget.attrs
+        set_attribute(self, 'attrs', self._get_inner_widget().attrs)
+        # A ToggleDeferral instance if this widget should be deferred while
+        # hidden
+        set_attribute(self, 'deferral', None)
+        # The ToggledWidgetWrapper whose visibility this cohort follows
+        set_attribute(self, 'master', None)
+
+    def _get_inner_widget(self):
+        if isinstance(self.widget, RelatedFieldWidgetWrapper):
+            return self.widget.widget
+        return self.widget
 
     def __setattr__(self, name, value):
-        if name in self._UNDELEGATED_ATTRIBUTES:
+        if name in self._undelegated_attributes:
             object.__setattr__(self, name, value)
         else:
             setattr(self.widget, name, value)
 
     def __getattr__(self, name):
+        if name == 'widget':
+            # Not set yet; avoid infinite recursion.
+            raise AttributeError(name)
         return getattr(self.widget, name)
 
+    def __deepcopy__(self, memo):
+        # This has to be defined explicitly; otherwise the lookup would be
+        # delegated to the wrapped widget, and the copy would lose the wrapper.
+        obj = object.__new__(type(self))
+        memo[id(self)] = obj
+        self._copy_state(obj, memo)
+        return obj
+
+    def _copy_state(self, obj, memo):
+        set_attribute = object.__setattr__
+        widget = deepcopy(self.widget, memo)
+        set_attribute(obj, 'widget', widget)
+        set_attribute(obj, '_is_hidden', self._is_hidden)
+        set_attribute(obj, 'attrs', obj._get_inner_widget().attrs)
+        set_attribute(obj, 'deferral', self.deferral)
+        set_attribute(obj, 'master', deepcopy(self.master, memo))
+        # Subclasses that don't define __slots__ have a __dict__.
+        try:
+            obj.__dict__.update(deepcopy(self.__dict__, memo))
+        except AttributeError:
+            pass
+
+    # Django reads these often while building and rendering forms, and
+    # delegating them explicitly is much cheaper than going through
+    # __getattr__, which only runs after the normal lookup has failed.
+    @property
+    def media(self):
+        return self.widget.media
+
+    @property
+    def is_required(self):
+        return self.widget.is_required
+
+    @property
+    def is_localized(self):
+        return self.widget.is_localized
+
+    @property
+    def needs_multipart_form(self):
+        return self.widget.needs_multipart_form
+
+    @property
+    def template_name(self):
+        return self.widget.template_name
+
+    def use_required_attribute(self, initial):
+        return self.widget.use_required_attribute(initial)
+
+    def value_from_datadict(self, data, files, name):
+        return self.widget.value_from_datadict(data, files, name)
+
+    def value_omitted_from_data(self, data, files, name):
+        # The values of fields that the toggling hides are set empty when the
+        # form is cleaned, and construct_instance() has to save them even if
+        # the widgets weren't submitted (e.g. because they were deferred).
+        if self._is_toggled_off():
+            return False
+        return self.widget.value_omitted_from_data(data, files, name)
+
+    def id_for_label(self, id_):
+        return self.widget.id_for_label(id_)
+
+    def render(self, name, value, attrs=None, renderer=None):
+        # Only widgets hidden by the toggling are deferred; a widget that's
+        # hidden by type (e.g. HiddenInput) still has to be submitted.
+        if self.deferral is not None and self._is_toggled_off():
+            return self.deferral.render(self, name, value, attrs, renderer)
+        return self.render_widget(name, value, attrs, renderer)
+
+    def render_widget(self, name, value, attrs=None, renderer=None):
+        """
+        Renders the wrapped widget, regardless of any deferral.
+        """
+        return self.widget.render(name, value, attrs, renderer)
+
     def _set_visibility(self, is_hidden):
-        self._is_hidden = is_hidden
+        object.__setattr__(self, '_is_hidden', is_hidden)
+
+    def _is_toggled_off(self):
+        """
+        Returns whether the toggling state (as opposed to the wrapped widget)
+        hides this widget.
+        """
+        return self._is_hidden or (self.master is not None and self.master._is_toggled_off())
 
     @property
     def is_hidden(self):
-        return self._is_hidden or self.widget.is_hidden
+        return self._is_toggled_off() or self.widget.is_hidden
 
     @is_hidden.setter
     def is_hidden(self, is_hidden):
         self._set_visibility(is_hidden)
 
+ToggledWidgetCohortWrapper._undelegated_attributes = frozenset(
+    ToggledWidgetCohortWrapper._UNDELEGATED_ATTRIBUTES
+)
+
 class ToggledWidgetWrapper(ToggledWidgetCohortWrapper):
     """
     Wrapper class for widgets that control a toggling relationship.
     """
+    __slots__ = ('field_name', 'widget_group', 'cohorts', 'metafield', 'group_state')
     _UNDELEGATED_ATTRIBUTES = ToggledWidgetCohortWrapper._UNDELEGATED_ATTRIBUTES + (
         'field_name',
         'widget_group',
         'cohorts',
         'metafield',
+        'group_state',
         'lock',
         # These are aliases for backward compatibility, subject to future removal
         'set_visible',
@@ -129,15 +545,38 @@ class ToggledWidgetWrapper(ToggledWidgetCohortWrapper):
 
     def __init__(self, widget, field_name, group, cohorts, metafield):
         super().__init__(widget)
-        self.field_name = field_name
-        self.widget_group = group
         for cohort in cohorts:
             if not isinstance(cohort, ToggledWidgetCohortWrapper):
                 raise TypeError(
                     'Cohort widgets must be ToggledWidgetCohortWrapper instances.'
                 )
-        self.cohorts = cohorts
-        self.metafield = metafield
+        set_attribute = object.__setattr__
+        set_attribute(self, 'field_name', field_name)
+        set_attribute(self, 'widget_group', group)
+        set_attribute(self, 'cohorts', cohorts)
+        set_attribute(self, 'metafield', metafield)
+        # The members of a group share its state; since the group is built up
+        # one member at a time, any member already in it has the state.
+        for member in group:
+            if isinstance(member, ToggledWidgetWrapper):
+                set_attribute(self, 'group_state', member.group_state)
+                break
+        else:
+            set_attribute(self, 'group_state', ToggleGroupState())
+        for cohort in cohorts:
+            set_attribute(cohort, 'master', self)
+
+    def _copy_state(self, obj, memo):
+        super()._copy_state(obj, memo)
+        set_attribute = object.__setattr__
+        # The field name is immutable, so it's shared. The memo ensures that
+        # the members of the group, the cohorts and the metafield are the
+        # same objects as those in the copied form's fields.
+        set_attribute(obj, 'field_name', self.field_name)
+        set_attribute(obj, 'widget_group', deepcopy(self.widget_group, memo))
+        set_attribute(obj, 'cohorts', deepcopy(self.cohorts, memo))
+        set_attribute(obj, 'metafield', deepcopy(self.metafield, memo))
+        set_attribute(obj, 'group_state', deepcopy(self.group_state, memo))
 
     def lock(self):
         """
@@ -151,16 +590,66 @@ class ToggledWidgetWrapper(ToggledWidgetCohortWrapper):
         # Do this to prevent the metafield from showing up
         self.metafield.widget = HiddenInput()
 
+    def render_widget(self, name, value, attrs=None, renderer=None):
+        # If this widget is toggled off and the admin has provided a URL from
+        # which the choices can be loaded on demand, don't evaluate the
+        # queryset; render only the empty and selected options, and let the
+        # client side fetch the rest when the widget is shown.
+        inner_widget = self._get_inner_widget()
+        if not (self._is_toggled_off() and
+                'data-toggle-choices-url' in inner_widget.attrs and
+                isinstance(inner_widget.choices, ModelChoiceIterator)):
+            return self.widget.render(name, value, attrs, renderer)
+        iterator = inner_widget.choices
+        inner_widget.choices = self._get_deferred_choices(iterator, value)
+        try:
+            return self.widget.render(
+                name, value, dict(attrs or (), **{'data-deferred-choices': 'true'}), renderer
+            )
+        finally:
+            inner_widget.choices = iterator
+
+    @staticmethod
+    def _get_deferred_choices(iterator, value):
+        field = iterator.field
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        values = [v for v in value if v not in field.empty_values]
+        choices = []
+        if field.empty_label is not None:
+            choices.append(('', field.empty_label))
+        if values:
+            key = field.to_field_name or 'pk'
+            try:
+                choices.extend(
+                    iterator.choice(obj)
+                    for obj in field.queryset.filter(**{key + '__in': values})
+                )
+            except (ValueError, TypeError, ValidationError):
+                # Invalid submitted data; there's nothing to select.
+                pass
+        return choices
+
     def _set_visibility(self, is_hidden):
         super()._set_visibility(is_hidden)
-        for cohort in self.cohorts:
-            cohort.is_hidden = is_hidden
-        if not is_hidden:
-            for widget in self.widget_group:
-                if widget is not self:
-                    widget.is_hidden = True
+        # Making this the active member hides the others (and the cohorts
+        # follow their masters), so there's nothing to propagate.
+        if not is_hidden and self.group_state.active is not self:
+            self.group_state.active = self
             self.metafield.initial = self.field_name
 
+    def _is_toggled_off(self):
+        active = self.group_state.active
+        return self._is_hidden or (active is not None and active is not self)
+
+    # This is read often enough to be worth inlining _is_toggled_off().
+    def _get_is_hidden(self):
+        active = self.group_state.active
+        return self._is_hidden or (active is not None and active is not self) or \
+            self.widget.is_hidden
+
+    is_hidden = property(_get_is_hidden, ToggledWidgetCohortWrapper.is_hidden.fset)
+
     # Aliases for backward compatibility
     def set_visible(self):
         self.is_hidden = False
@@ -217,8 +706,9 @@ class ToggledWidgetModelFormMetaclass(ModelFormMetaclass):
                 # It's probably possible to set the choices at this stage, but
                 # it's somewhat awkward to do so due to the fact that the fields
                 # in question might be inherited from a parent. Rather than walk
-                # the inheritance tree in search of them, we can defer this to the
-                # form initializer.
+                # the inheritance tree in search of them, we can defer this to
+                # compile_toggle_plan(), which runs the first time the form is
+                # instantiated.
                 attrs[metafield_name] = Metafield(
                     widget=metafield_widget(attrs={'class': 'toggle-metafield'})
                 )
@@ -230,6 +720,87 @@ class ToggledWidgetModelFormMetaclass(ModelFormMetaclass):
     def get_metafield_name(field_name):
         return '{}_metafield'.format(field_name)
 
+    @staticmethod
+    def compile_toggle_plan(form_class):
+        """
+        Builds the ToggleFormPlan describing the given form class' toggle
+        groups. This has to wait until the class has been created, since the
+        fields involved may be inherited. As a side effect, the class' own
+        copies of the metafields receive their choices, so that form instances
+        inherit them when the base fields are copied.
+        """
+        toggle_groups = form_class.toggle_groups
+        group_plans = []
+        cohort_fields_index = {}
+        attname_index = {}
+        try:
+            model_options = form_class._meta.model._meta
+        except AttributeError:
+            model_options = None
+        # Each widget gets an ID that's unique within the context of the
+        # form, and each toggled widget group gets such an ID. Cohorts also get
+        # tied to the controlling widget via its ID.
+        toggle_id_iterator = count(len(toggle_groups))
+        for group_id, group in enumerate(toggle_groups):
+            members = []
+            choices = []
+            for field_name, cohorts in group:
+                toggle_id = next(toggle_id_iterator)
+                try:
+                    field = form_class.base_fields[field_name]
+                except KeyError:
+                    # The field is added in __modify_fields__(), so the label
+                    # can only be resolved for each form.
+                    label_key = None
+                    label = pretty_name(field_name)
+                else:
+                    label_key = ToggleMemberPlan.get_label_key(field)
+                    label = ToggleMemberPlan.resolve_label(field, field_name)
+                members.append(ToggleMemberPlan(
+                    field_name,
+                    toggle_id,
+                    tuple(cohorts),
+                    MappingProxyType({
+                        'data-toggle-id': toggle_id,
+                        'data-toggle-group-id': group_id
+                    }),
+                    label_key,
+                    label
+                ))
+                choices.append((field_name, label))
+                # For relations, this is the name of the attribute holding
+                # the stored column value rather than the related object.
+                try:
+                    attname_index[field_name] = model_options.get_field(field_name).attname
+                except (AttributeError, FieldDoesNotExist):
+                    attname_index[field_name] = field_name
+                for cohort in cohorts:
+                    cohort_fields_index[cohort] = field_name
+            metafield_name = form_class._metafield_index[group[0][0]]
+            # Metafield instances are shared with subclasses via
+            # declared_fields, so give this class its own copy.
+            metafield = deepcopy(form_class.base_fields[metafield_name])
+            metafield.widget.attrs['data-toggle-group-id'] = group_id
+            metafield.choices = choices
+            form_class.base_fields[metafield_name] = metafield
+            group_plans.append(ToggleGroupPlan(
+                group_id,
+                metafield_name,
+                tuple(members)
+            ))
+        return ToggleFormPlan(
+            tuple(group_plans),
+            MappingProxyType(cohort_fields_index),
+            MappingProxyType(attname_index),
+            # Each metafield carries the description of its own group, so
+            # that a group works as long as its metafield is rendered.
+            MappingProxyType({
+                group_plan.metafield_name: json.dumps([[group_plan.metafield_name, [
+                    [member.field_name, list(member.cohorts)] for member in group_plan.members
+                ]]], separators=(',', ':')) for group_plan in group_plans
+            })
+        )
+
     @staticmethod
     def split_group_member(member):
         """
@@ -248,6 +819,137 @@ class ToggledWidgetModelFormMetaclass(ModelFormMetaclass):
                 'objects containing multiple strings.'
             )
 
+class ToggleMemberPlan(namedtuple('ToggleMemberPlan', (
+    'field_name', 'toggle_id', 'cohorts', 'attrs', 'label_key', 'label'
+))):
+    """
+    Precomputed, per-class description of a single member of a toggle group.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def get_label_key(field):
+        widget = field.widget
+        if isinstance(widget, ToggledWidgetCohortWrapper):
+            widget = widget.widget
+        return (type(widget), getattr(widget, 'metafield_label', None), field.label)
+
+    @staticmethod
+    def resolve_label(field, field_name):
+        try:
+            metafield_label = field.widget.get_metafield_label()
+        except AttributeError:
+            metafield_label = None
+        return metafield_label or field.label or pretty_name(field_name)
+
+    def is_label_stale(self, field):
+        """
+        Returns whether the given field has been modified since
+        the plan was compiled in a way that might affect its metafield label
+        (or didn't exist when the plan was compiled).
+        """
+        return self.get_label_key(field) != self.label_key
+
+ToggleGroupPlan = namedtuple('ToggleGroupPlan', ('group_id', 'metafield_name', 'members'))
+
+ToggleFormPlan = namedtuple('ToggleFormPlan', (
+    'groups', 'cohort_fields_index', 'attname_index', 'manifest_groups'
+))
+
+class ToggleResolver:
+    """
+    Applies the toggle semantics of a ToggledWidgetFormMixin subclass to
+    plain dicts (e.g. rows from an import or an API request) without
+    instantiating the form: in each group, only the active member and its
+    cohorts keep their values, and the others are set to the same empty
+    values that the form's clean() method would use. Values aren't otherwise
+    cleaned or validated. Use ToggledWidgetFormMixin.get_toggle_resolver() to
+    get an instance for a form class.
+    """
+    def __init__(self, form_class):
+        plan = form_class.get_toggle_plan()
+        self._groups = []
+        for group_plan in plan.groups:
+            empties = {
+                field_name: form_class.get_base_empty_value(field_name)
+                for member in group_plan.members
+                for field_name in chain((member.field_name,), member.cohorts)
+            }
+            # For each member, the values to set when it's the active one
+            clearing = {}
+            for member in group_plan.members:
+                clearing[member.field_name] = {
+                    field_name: empties[field_name]
+                    for other in group_plan.members if other is not member
+                    for field_name in chain((other.field_name,), other.cohorts)
+                }
+            self._groups.append((
+                group_plan.metafield_name,
+                tuple(member.field_name for member in group_plan.members),
+                clearing
+            ))
+
+    def get_active_members(self, row):
+        """
+        Returns a dict associating the name of each metafield with the name of
+        the active member of its group in the given dict. If the dict contains
+        a value for the metafield, that value is used; otherwise, the active
+        member is inferred the same way as for unbound forms, i.e. it is
+        whichever member has a value, defaulting to the first. Raises
+        ValueError if a metafield value isn't the name of a member of its
+        group.
+        """
+        return {
+            metafield_name: self._get_active_member(row, metafield_name, members, clearing)
+            for metafield_name, members, clearing in self._groups
+        }
+
+    @staticmethod
+    def _get_active_member(row, metafield_name, members, clearing):
+        active = row.get(metafield_name)
+        if active in (None, ''):
+            active = members[0]
+            for field_name in members:
+                if row.get(field_name):
+                    active = field_name
+        elif active not in clearing:
+            raise ValueError('{!r} is not a valid value for {}.'.format(active, metafield_name))
+        return active
+
+    def resolve(self, row, in_place=False, include_metafields=False):
+        """
+        Returns a dict containing the values in the given one, with those of
+        the inactive members of each group and their cohorts set empty. The
+        metafields are left out of the result unless include_metafields is
+        true, in which case they are set to the names of the active members.
+        If in_place is true, the given dict is modified and returned.
+        """
+        result = row if in_place else dict(row)
+        for metafield_name, members, clearing in self._groups:
+            active = self._get_active_member(row, metafield_name, members, clearing)
+            result.update(clearing[active])
+            if include_metafields:
+                result[metafield_name] = active
+            else:
+                result.pop(metafield_name, None)
+        return result
+
+    def resolve_batch(self, rows, in_place=False, include_metafields=False):
+        """
+        Resolves each of the dicts in the given iterable and returns a list of
+        the results.
+        """
+        return list(self.iter_resolve(rows, in_place, include_metafields))
+
+    def iter_resolve(self, rows, in_place=False, include_metafields=False):
+        """
+        Lazily resolves each of the dicts in the given iterable, which may be
+        a stream of rows that shouldn't all be held in memory.
+        """
+        resolve = self.resolve
+        for row in rows:
+            yield resolve(row, in_place, include_metafields)
+
 class ToggledWidgetFormMixin(metaclass=ToggledWidgetModelFormMetaclass):
     """
     Provides special handling for the initialization and submission of forms
@@ -264,69 +966,187 @@ class ToggledWidgetFormMixin(metaclass=ToggledWidgetModelFormMetaclass):
     # inherit from django.forms.widgets.ChoiceWidget. The name of any field in
     # a toggle group may be used as the key.
     metafield_widgets = None
+    # If this is true, the fields that the submitted metafield values mark as
+    # inactive (and their cohorts) are not cleaned or validated at all; they
+    # are simply set empty in the cleaned data. Note that this also bypasses
+    # any clean_<field name>() methods for those fields.
+    skip_inactive_validation = False
+    # If this is true, toggled widgets (and their cohorts) that are hidden
+    # when the form is rendered are rendered inside inert <template> elements,
+    # which the client side replaces with the widgets when they are first
+    # shown. Within formsets whose empty form is rendered (e.g. admin
+    # inlines), hidden widgets with empty values aren't rendered at all; they
+    # are copied from the empty form instead.
+    defer_hidden_widgets = False
 
     def __init__(self, *args, **kwargs):
+        # ToggledWidgetFormSetMixin passes this to share state between forms.
+        self._toggle_formset_state = kwargs.pop('toggle_formset_state', None)
+        if self.toggle_groups is None:
+            raise SetupIncompleteError('This class must define the toggle_groups attribute.')
+        # The plan has to be in place before the parent constructor copies the
+        # base fields.
+        self._cohort_fields_index = self.get_toggle_plan().cohort_fields_index
         super().__init__(*args, **kwargs)
+        # The formset only shares the choices of querysets that
+        # __modify_fields__() leaves alone.
+        self._toggle_querysets = None if self._toggle_formset_state is None else \
+            self._toggle_formset_state.get_querysets(self)
         self.__modify_fields__(*args, **kwargs)
         self._group_index = {}
-        self._cohort_fields_index = {}
-        if self.toggle_groups is None:
-            raise SetupIncompleteError('This class must define the toggle_groups attribute.')
+        self._empty_values = {}
         self._setup()
 
+    @classmethod
+    def get_toggle_plan(cls):
+        """
+        Returns the ToggleFormPlan for this class, compiling it on first use.
+        """
+        try:
+            return cls.__dict__['_toggle_plan']
+        except KeyError:
+            pass
+        # Compiling the plan modifies the class' base fields, so make sure
+        # that concurrently constructed forms don't do it at the same time.
+        with _toggle_class_lock:
+            if '_toggle_plan' not in cls.__dict__:
+                cls._toggle_plan = ToggledWidgetModelFormMetaclass.compile_toggle_plan(cls)
+            return cls._toggle_plan
+
+    @classmethod
+    def get_toggle_resolver(cls):
+        """
+        Returns the ToggleResolver for this class, creating it on first use.
+        """
+        try:
+            return cls.__dict__['_toggle_resolver']
+        except KeyError:
+            pass
+        with _toggle_class_lock:
+            if '_toggle_resolver' not in cls.__dict__:
+                cls._toggle_resolver = ToggleResolver(cls)
+            return cls._toggle_resolver
+
+    @classmethod
+    def get_base_empty_value(cls, field_name):
+        """
+        Returns the value that clean() sets for the named toggled field (or
+        cohort) when it's inactive, as far as can be told without a form
+        instance. Fields that are added in __modify_fields__() aren't among
+        the base fields, so for those, the default form field of the model
+        field with the same name is used, or failing that, an empty string.
+        """
+        try:
+            return cls.base_fields[field_name].to_python('')
+        except KeyError:
+            pass
+        try:
+            field = cls._meta.model._meta.get_field(field_name).formfield()
+        except (AttributeError, FieldDoesNotExist):
+            field = None
+        return '' if field is None else field.to_python('')
+
+    @staticmethod
+    def _wrap_group(fields, group_plan):
+        """
+        Wraps the widgets of the fields in the given dict that belong to the
+        given group and returns the list of ToggledWidgetWrapper instances.
+        """
+        metafield = fields[group_plan.metafield_name]
+        widget_group = []
+        for member in group_plan.members:
+            field = fields[member.field_name]
+            cohort_widgets = []
+            for cohort in member.cohorts:
+                cohort_field = fields[cohort]
+                cohort_field.widget = ToggledWidgetCohortWrapper(cohort_field.widget)
+                cohort_field.widget.attrs['data-master-toggle-id'] = member.toggle_id
+                cohort_widgets.append(cohort_field.widget)
+            field.widget = ToggledWidgetWrapper(
+                field.widget, member.field_name, widget_group, cohort_widgets, metafield
+            )
+            widget_group.append(field.widget)
+            attrs = field.widget.attrs
+            try:
+                if 'toggled-widget' not in attrs['class']:
+                    attrs['class'] += ' toggled-widget'
+            except KeyError:
+                attrs['class'] = 'toggled-widget'
+            attrs.update(member.attrs)
+        return widget_group
+
+    @_instrumented('setup', _count_toggle_plan)
     def _setup(self):
-        for group_id, group in enumerate(self.toggle_groups):
-            toggle_id_iterator = iter(range(len(self.toggle_groups), sys.maxsize))
-            metafield_name = self._metafield_index[group[0][0]]
-            metafield = self.fields[metafield_name]
-            metafield.widget.attrs['data-toggle-group-id'] = group_id
-            metafield.choices = []
-            self._group_index[metafield_name] = widget_group = []
-            # As the initial value of the metafield, use the name of whichever
-            # field has a value, defaulting to the first field in the group if
-            # none do.
-            initial_field = None
-            for field_name, cohorts in group:
-                field = self.fields[field_name]
-                if getattr(self.instance, field_name, None):
-                    initial_field = field_name
-                # Each widget gets an ID that's unique within the context of
-                # its fieldset, and each toggled widget group gets such an ID.
-                # Cohorts also get tied to the controlling widget via its ID.
-                toggle_id = next(toggle_id_iterator)
-                cohort_widgets = []
-                for cohort in cohorts:
-                    self.fields[cohort].widget = ToggledWidgetCohortWrapper(
-                        self.fields[cohort].widget
-                    )
-                    self.fields[cohort].widget.attrs['data-master-toggle-id'] = toggle_id
-                    cohort_widgets.append(self.fields[cohort].widget)
-                    self._cohort_fields_index[cohort] = field_name
-                field.widget = ToggledWidgetWrapper(
-                    field.widget, field_name, widget_group, cohort_widgets, metafield
+        deferral = self.get_toggle_deferral() if self.defer_hidden_widgets else None
+        for group_plan in self.get_toggle_plan().groups:
+            widget_group = self._group_index[group_plan.metafield_name] = self._wrap_group(
+                self.fields, group_plan
+            )
+            if deferral is not None:
+                # Widgets with scripts of their own may only be set up when
+                # the page loads, which a deferred widget would miss.
+                for widget in chain.from_iterable(
+                    chain((member,), member.cohorts) for member in widget_group
+                ):
+                    if not _has_widget_scripts(widget._get_inner_widget()):
+                        widget.deferral = deferral
+            # The admin view from which deferred choices are loaded builds
+            # the form for this instance, in case they depend on it.
+            pk = getattr(getattr(self, 'instance', None), 'pk', None)
+            if pk is not None:
+                for widget in widget_group:
+                    _add_toggled_choices_param(widget._get_inner_widget(), 'row', pk)
+            if self._toggle_formset_state is not None:
+                self._toggle_formset_state.share_choices(
+                    self.fields, group_plan, self._toggle_querysets
                 )
-                widget_group.append(field.widget)
-                try:
-                    if 'toggled-widget' not in field.widget.attrs['class']:
-                        field.widget.attrs['class'] += ' toggled-widget'
-                except KeyError:
-                    field.widget.attrs['class'] = 'toggled-widget'
-                field.widget.attrs['data-toggle-id'] = toggle_id
-                field.widget.attrs['data-toggle-group-id'] = group_id
-                try:
-                    metafield_label = field.widget.get_metafield_label()
-                except AttributeError:
-                    metafield_label = None
-                metafield.choices.append((
-                    field_name, metafield_label or field.label or pretty_name(field_name)
-                ))
+            # The metafield's choices were set on the class by
+            # compile_toggle_plan(), but subclasses may have changed the
+            # fields in a way that affects the labels.
+            for member in group_plan.members:
+                if member.is_label_stale(self.fields[member.field_name]):
+                    self.fields[group_plan.metafield_name].choices = [
+                        (m.field_name, m.resolve_label(self.fields[m.field_name], m.field_name))
+                        for m in group_plan.members
+                    ]
+                    break
             # Skip this for bound forms; the field value will come from the
             # form data, so set it during cleaning.
             if not self.is_bound:
-                if not initial_field:
-                    initial_field = group[0][0]
+                # As the initial value of the metafield, use the name of
+                # whichever field has a value, defaulting to the first field
+                # in the group if none do.
+                initial_field = group_plan.members[0].field_name
+                for member in group_plan.members:
+                    if self.get_initial_toggle_value(member.field_name):
+                        initial_field = member.field_name
                 self.fields[initial_field].widget.is_hidden = False
 
+    def get_toggle_deferral(self):
+        """
+        Returns the ToggleDeferral instance describing how this form's hidden
+        toggled widgets are deferred.
+        """
+        prefix, is_formset = self.get_toggle_manifest_prefix()
+        state = self._toggle_formset_state
+        if is_formset and state is not None and state.defer_to_empty_form:
+            return ToggleDeferral(
+                self.prefix, prefix + '-__prefix__', state.get_source_names(self)
+            )
+        return ToggleDeferral(self.prefix, None, frozenset())
+
+    def get_initial_toggle_value(self, field_name):
+        """
+        Returns the value of the given toggled field on the model instance,
+        which determines whether it is the initially visible one within its
+        group. For relations, this is the stored key rather than the related
+        object, so that no query is needed. Subclasses may override this to
+        base the decision on something else.
+        """
+        return getattr(
+            self.instance, self.get_toggle_plan().attname_index[field_name], None
+        )
+
     @staticmethod
     def build_metafield_name(field_name):
         warn(
@@ -348,15 +1168,23 @@ class ToggledWidgetFormMixin(metaclass=ToggledWidgetModelFormMetaclass):
 
     def add_error(self, field, error):
         super().add_error(field, error)
-        # If this error is on a field involved in a toggle relationship, make
-        # sure it's visible when the form is rendered.
+        self._reveal_error_fields(field, error)
+
+    @_instrumented('add_error', lambda form, result: {'revealed': result})
+    def _reveal_error_fields(self, field, error):
+        """
+        If the given error is on a field involved in a toggle relationship,
+        makes sure it's visible when the form is rendered. Returns the number
+        of toggled widgets affected.
+        """
         if field is None:
             try:
                 fields = error.error_dict.keys()
             except AttributeError:
-                return
+                return 0
         else:
             fields = [field]
+        revealed = 0
         for field in fields:
             try:
                 field_instance = self.fields[self._cohort_fields_index[field]]
@@ -365,108 +1193,627 @@ class ToggledWidgetFormMixin(metaclass=ToggledWidgetModelFormMetaclass):
                 if not field_instance or not isinstance(field_instance.widget, ToggledWidgetWrapper):
                     continue
             field_instance.widget.is_hidden = False
+            revealed += 1
+        return revealed
 
+    def _get_empty_value(self, field_name):
+        try:
+            return self._empty_values[field_name]
+        except KeyError:
+            value = self._empty_values[field_name] = self.fields[field_name].to_python('')
+            return value
+
+    def _get_inactive_field_names(self):
+        """
+        Returns the names of the toggled fields and cohorts that are inactive
+        according to the submitted metafield values. Groups whose metafield
+        value is invalid are left out, so that their fields are validated
+        normally.
+        """
+        inactive = []
+        for group_plan in self.get_toggle_plan().groups:
+            try:
+                metafield_value = self.fields[group_plan.metafield_name].clean(
+                    self[group_plan.metafield_name].data
+                )
+            except ValidationError:
+                continue
+            for member in group_plan.members:
+                if member.field_name != metafield_value:
+                    inactive.append(member.field_name)
+                    inactive.extend(member.cohorts)
+        return inactive
+
+    def _clean_fields(self):
+        if not self.skip_inactive_validation:
+            return super()._clean_fields()
+        inactive = self._get_inactive_field_names()
+        inactive_set = set(inactive)
+        # This follows BaseForm._clean_fields(), except for skipping the
+        # inactive fields. self.fields is left as it is, so that
+        # clean_<field name>() methods can still refer to them (e.g. to add
+        # errors to them).
+        for name in self.fields:
+            if name in inactive_set:
+                continue
+            try:
+                self.cleaned_data[name] = self._clean_bound_field(self[name])
+                if hasattr(self, 'clean_%s' % name):
+                    self.cleaned_data[name] = getattr(self, 'clean_%s' % name)()
+            except ValidationError as e:
+                self.add_error(name, e)
+        for field_name in inactive:
+            self.cleaned_data[field_name] = self._get_empty_value(field_name)
+
+    @staticmethod
+    def _clean_bound_field(bound_field):
+        field = bound_field.field
+        if hasattr(field, '_clean_bound_field'):
+            return field._clean_bound_field(bound_field)
+        # Django < 4.0
+        value = bound_field.initial if field.disabled else bound_field.data
+        if isinstance(field, FileField):
+            return field.clean(value, bound_field.initial)
+        return field.clean(value)
+
+    @_instrumented('clean', _count_toggle_plan)
     def clean(self, *args, **kwargs):
         cleaned_data = super().clean(*args, **kwargs)
         # Unset the values of any currently inactive fields
         for group in self.toggle_groups:
-            metafield_value = cleaned_data[self._metafield_index[group[0][0]]]
+            try:
+                metafield_value = cleaned_data[self._metafield_index[group[0][0]]]
+            except KeyError:
+                # The metafield is invalid, so the form is too, and its
+                # fields have all been validated.
+                continue
             for field_name, cohorts in group:
                 if field_name == metafield_value:
                     self.fields[field_name].widget.is_hidden = False
                 else:
-                    cleaned_data[field_name] = self.fields[field_name].to_python('')
+                    cleaned_data[field_name] = self._get_empty_value(field_name)
                     for cohort in cohorts:
-                        cleaned_data[cohort] = self.fields[cohort].to_python('')
+                        cleaned_data[cohort] = self._get_empty_value(cohort)
         return cleaned_data
 
+    def get_toggle_manifest_prefix(self):
+        """
+        Returns a tuple of the prefix that the toggle manifest should be
+        rendered with and whether that prefix belongs to a formset, in which
+        case the client side applies it to each form in the formset. Forms are
+        only known to belong to formsets that use ToggledWidgetFormSetMixin.
+        """
+        state = self._toggle_formset_state
+        if state is not None and state.prefix is not None:
+            return state.prefix, True
+        return self.prefix, False
+
+    def render_toggle_manifest(self, metafield_name):
+        """
+        Returns the <script> element containing the JSON description of the
+        named metafield's toggle group if it should be rendered along with the
+        metafield, or an empty string if not. For forms in a formset, it is
+        rendered only for the first form and the empty form; the client side
+        merges the descriptions of a form's groups and ignores duplicates.
+        """
+        plan = self.get_toggle_plan()
+        try:
+            manifest_groups = plan.manifest_groups[metafield_name]
+        except KeyError:
+            return ''
+        prefix, is_formset = self.get_toggle_manifest_prefix()
+        if is_formset and self.prefix not in (prefix + '-0', prefix + '-__prefix__'):
+            return ''
+        html = format_html(
+            '<script type="application/json" class="toggle-manifest">'
+            '{{"prefix":{},"formset":{},"groups":{}}}</script>',
+            mark_safe(json.dumps(prefix).translate(_JSON_SCRIPT_ESCAPES)),
+            'true' if is_formset else 'false',
+            mark_safe(manifest_groups.translate(_JSON_SCRIPT_ESCAPES))
+        )
+        # The empty form of a formset whose other forms defer their hidden
+        # widgets to it renders each of the group's toggled widgets once as a
+        # source.
+        deferral = self.get_toggle_deferral() if self.defer_hidden_widgets else None
+        if is_formset and deferral is not None and deferral.source_prefix == self.prefix:
+            for group_plan in plan.groups:
+                if group_plan.metafield_name == metafield_name:
+                    html += mark_safe(''.join(
+                        ToggleDeferral.render_source(self[field_name])
+                        for member in group_plan.members
+                        for field_name in chain((member.field_name,), member.cohorts)
+                        if field_name in deferral.source_names
+                    ))
+                    break
+        return html
+
+    def has_active_toggle_groups(self):
+        """
+        Returns whether any of this form's toggle groups can be toggled on the
+        client side, i.e. whether any metafield is rendered visibly (which
+        isn't the case once one of the group's widgets is locked).
+        """
+        return any(
+            not self.fields[metafield_name].widget.is_hidden
+            for metafield_name in self._group_index
+        )
+
     @property
     def media(self):
-        return super().media + Media(js=(
-            'admin/js/jquery.init.js',
-            'admin/js/DjangoAdminFieldContext.js',
-            'admin/js/ToggledWidget.js',
-            'admin/js/ToggledWidget.init.js'
-        ), css={'all': ('admin/css/ToggledWidget.css',)})
+        media = super().media
+        # There's nothing for the scripts to do if nothing can be toggled.
+        if not self.has_active_toggle_groups():
+            return media
+        if getattr(settings, 'TOGGLED_WIDGETS_BUNDLED_MEDIA', False):
+            return media + _BUNDLED_TOGGLE_MEDIA
+        return media + _TOGGLE_MEDIA
+
+class SharedModelChoiceIterator(ModelChoiceIterator):
+    """
+    ModelChoiceIterator that evaluates its queryset only once, however many
+    times it is iterated, so that it can be shared by the widgets of many
+    forms.
+    """
+    def __init__(self, field):
+        super().__init__(field)
+        self._choices = None
+
+    def __iter__(self):
+        if self._choices is None:
+            self._choices = list(super().__iter__())
+        return iter(self._choices)
+
+    def __len__(self):
+        return len(list(self))
+
+    def __bool__(self):
+        return bool(list(self))
+
+class ToggleFormSetState:
+    """
+    Toggle state shared by all of the forms in a formset with the given
+    prefix.
+    """
+    def __init__(self, share_choices, defer_to_empty_form=False, prefix=None):
+        self._share_choices = share_choices
+        self._choices = {}
+        self._source_names = None
+        self.defer_to_empty_form = defer_to_empty_form
+        self.prefix = prefix
+
+    def get_querysets(self, form):
+        """
+        Returns a dict associating the name of each of the given form's
+        toggled ModelChoiceFields (including cohorts) with its current
+        queryset, or None if choices aren't shared. This is called before the
+        form's __modify_fields__() hook runs, so that share_choices() can
+        leave out the fields whose querysets the hook replaces.
+        """
+        if not self._share_choices:
+            return None
+        fields = form.fields
+        return {
+            field_name: fields[field_name].queryset
+            for group_plan in form.get_toggle_plan().groups
+            for member in group_plan.members
+            for field_name in chain((member.field_name,), member.cohorts)
+            if isinstance(fields[field_name], ModelChoiceField)
+        }
+
+    def get_source_names(self, form):
+        """
+        Returns the set of names of the given form's toggled fields (including
+        cohorts) whose initial values in the formset's empty form are empty,
+        so that the empty form's widgets can stand in for the other forms'
+        hidden widgets with empty values.
+        """
+        if self._source_names is None:
+            field_names = [
+                field_name
+                for group_plan in form.get_toggle_plan().groups
+                for member in group_plan.members
+                for field_name in chain((member.field_name,), member.cohorts)
+            ]
+            # This is what the initial values of the empty form come from.
+            model = getattr(getattr(form, '_meta', None), 'model', None)
+            initial = model_to_dict(model(), field_names) if model is not None else {}
+            source_names = set()
+            for field_name in field_names:
+                value = initial.get(field_name, form.fields[field_name].initial)
+                if callable(value):
+                    value = value()
+                if value in EMPTY_VALUES:
+                    source_names.add(field_name)
+            self._source_names = frozenset(source_names)
+        return self._source_names
+
+    def share_choices(self, fields, group_plan, querysets):
+        """
+        Has the toggled ModelChoiceField widgets in the given group (including
+        cohorts) use choices shared with the other forms in the formset,
+        except for those whose querysets are no longer the ones in the given
+        dict returned by get_querysets().
+        """
+        if not self._share_choices:
+            return
+        for member in group_plan.members:
+            for field_name in chain((member.field_name,), member.cohorts):
+                field = fields[field_name]
+                if not isinstance(field, ModelChoiceField) or \
+                        field.queryset is not querysets.get(field_name):
+                    continue
+                try:
+                    choices = self._choices[field_name]
+                except KeyError:
+                    choices = self._choices[field_name] = SharedModelChoiceIterator(field)
+                field.widget._get_inner_widget().choices = choices
+
+class ToggledWidgetFormSetMixin:
+    """
+    Formset mixin that has its forms share the toggle state that doesn't vary
+    between them, so that each form only has to determine its own visibility.
+    This has no effect if the formset's form class doesn't use
+    ToggledWidgetFormMixin.
+    """
+    # If this is true, the toggled ModelChoiceField widgets of all of the
+    # forms share a single evaluation of their querysets, rather than each
+    # one querying the database when rendered. Fields whose querysets a form
+    # replaces in __modify_fields__() keep their own choices.
+    share_toggled_choices = True
+    # Set this to true if the formset's empty form is rendered along with the
+    # other forms (as in admin inlines), so that forms whose class sets
+    # defer_hidden_widgets can copy hidden widgets from it on the client side
+    # instead of rendering them.
+    defer_to_empty_form = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._toggle_formset_state = ToggleFormSetState(
+            self.share_toggled_choices, self.defer_to_empty_form, self.prefix
+        )
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        if issubclass(self.form, ToggledWidgetFormMixin):
+            kwargs['toggle_formset_state'] = self._toggle_formset_state
+        return kwargs
+
+    @classmethod
+    def mix_into(cls, formset, **attrs):
+        """
+        Returns a subclass of the given formset class that uses this mixin,
+        with the given class attributes, if any.
+        """
+        if issubclass(formset, cls) and all(
+            getattr(formset, name) == value for name, value in attrs.items()
+        ):
+            return formset
+        key = (cls, formset, tuple(sorted(attrs.items())))
+        try:
+            return _toggled_formset_classes[key]
+        except KeyError:
+            bases = (formset,) if issubclass(formset, cls) else (cls, formset)
+            subclass = _toggled_formset_classes[key] = type(
+                formset.__name__, bases, dict(attrs, __module__=formset.__module__)
+            )
+            return subclass
+
+_TOGGLE_MEDIA = Media(js=(
+    'admin/js/jquery.init.js',
+    'admin/js/ToggledWidget.js',
+    'admin/js/ToggledWidget.init.js'
+), css={'all': ('admin/css/ToggledWidget.css',)})
+
+def _add_toggled_choices_param(widget, name, value):
+    """
+    Adds the given query string parameter, whose value is a primary key, to
+    the URL from which the given widget's deferred choices are loaded, if it
+    has one.
+    """
+    url = widget.attrs.get('data-toggle-choices-url')
+    if url:
+        widget.attrs['data-toggle-choices-url'] = '{}{}{}={}'.format(
+            url, '&' if '?' in url else '?', name, quote_query_value(quote(str(value)))
+        )
+
+# Used instead when the TOGGLED_WIDGETS_BUNDLED_MEDIA setting is true
+_BUNDLED_TOGGLE_MEDIA = Media(
+    js=('admin/js/jquery.init.js', bundle.JS), css={'all': (bundle.CSS,)}
+)
+
+# Formset classes created by ToggledWidgetFormSetMixin.mix_into(), keyed by
+# the mixin, the original class and the attributes
+_toggled_formset_classes = {}
+
+# Metafield placements computed by ToggledWidgetAdminMixin, keyed by the
+# inputs that determine them
+_toggle_layout_cache = {}
 
 class ToggledWidgetAdminMixin:
     """
     ModelAdmin mixin that automatically adds all metafields to the fieldsets
     if necessary.
     """
-    def _insert_metafield(self, field_list, metafield, after):
-        if metafield not in field_list:
-            # The fields in the list won't necessarily be in the same order as
-            # the fields involved in the toggle group, so find whichever one
-            # appears latest in the list and insert it after that.
-            last_index = None
-            for field_name in after:
+    # If this is true, toggled ModelChoiceField widgets that are hidden when
+    # the form is rendered don't evaluate their querysets; their choices are
+    # fetched from toggled_choices_view() when they are first shown. For
+    # inlines, the parent ModelAdmin must also use this mixin.
+    defer_hidden_choices = False
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path(
+                'toggled-choices/<str:field_name>/',
+                self.admin_site.admin_view(self.toggled_choices_view),
+                name='%s_%s_toggled_choices' % info
+            )
+        ] + super().get_urls()
+
+    def get_formset(self, request, obj=None, **kwargs):
+        # This only applies to inlines, which always render the empty form.
+        kwargs['formset'] = ToggledWidgetFormSetMixin.mix_into(
+            kwargs.get('formset', self.formset), defer_to_empty_form=True
+        )
+        formset = super().get_formset(request, obj, **kwargs)
+        if self.defer_hidden_choices and obj is not None:
+            # The fields are created anew for each formset class, so they
+            # may be given the parent object's URL.
+            for field in formset.form.base_fields.values():
+                widget = field.widget
+                if isinstance(widget, RelatedFieldWidgetWrapper):
+                    widget = widget.widget
+                _add_toggled_choices_param(widget, 'object_id', obj.pk)
+        return formset
+
+    def get_changelist_formset(self, request, **kwargs):
+        kwargs['formset'] = ToggledWidgetFormSetMixin.mix_into(
+            kwargs.get('formset', BaseModelFormSet)
+        )
+        return super().get_changelist_formset(request, **kwargs)
+
+    @staticmethod
+    def _is_toggled_field(form, field_name):
+        """
+        Returns whether the given field name is a member (not a cohort) of one
+        of the given form class' toggle groups.
+        """
+        if field_name not in getattr(form, '_metafield_index', ()):
+            return False
+        return any(member[0] == field_name for group in form.toggle_groups for member in group)
+
+    def get_toggled_choices_url(self, field_name):
+        """
+        Returns the URL from which the choices for the given toggled field
+        may be loaded, or None if there isn't one.
+        """
+        parent_model = getattr(self, 'parent_model', None)
+        opts = (parent_model or self.model)._meta
+        try:
+            url = reverse(
+                '%s:%s_%s_toggled_choices' % (self.admin_site.name, opts.app_label, opts.model_name),
+                args=(field_name,),
+                current_app=self.admin_site.name
+            )
+        except NoReverseMatch:
+            return None
+        if parent_model:
+            url += '?inline=' + self.opts.label_lower
+        return url
+
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
+        if (self.defer_hidden_choices and
+                isinstance(formfield, ModelChoiceField) and
+                self._is_toggled_field(self.form, db_field.name)):
+            url = self.get_toggled_choices_url(db_field.name)
+            if url:
+                widget = formfield.widget
+                if isinstance(widget, RelatedFieldWidgetWrapper):
+                    widget = widget.widget
+                widget.attrs['data-toggle-choices-url'] = url
+        return formfield
+
+    def toggled_choices_view(self, request, field_name):
+        """
+        Returns the choices for the given toggled field as JSON, as the field
+        has them in the form for the object whose primary key is given by the
+        "row" query string parameter (or in a blank form, without one). The
+        "inline" parameter may name the model of one of this admin's inlines,
+        in which case "row" refers to one of that inline's rows, and the
+        "object_id" parameter to the object that the rows belong to.
+        """
+        inline_label = request.GET.get('inline')
+        row = request.GET.get('row')
+        object_id = request.GET.get('object_id') if inline_label else row
+        obj = None
+        if object_id is not None:
+            obj = self.get_object(request, unquote(object_id))
+            if obj is None:
+                raise Http404
+        if not self.has_view_or_change_permission(request, obj):
+            raise PermissionDenied
+        if inline_label:
+            for inline in self.get_inline_instances(request, obj):
+                if inline.opts.label_lower == inline_label:
+                    break
+            else:
+                raise Http404
+            formset_class = inline.get_formset(request, obj)
+            queryset = inline.get_queryset(request)
+            if row is None:
+                form = formset_class(instance=obj, queryset=queryset.none()).empty_form
+            else:
                 try:
-                    idx = field_list.index(field_name)
-                    if idx > (last_index or 0):
-                        last_index = idx
-                except ValueError:
-                    # This would mean that the field that should have preceded
-                    # the metafield isn't there. It's possible this could be
-                    # valid.
-                    pass
-            if last_index is None:
+                    forms = formset_class(
+                        instance=obj, queryset=queryset.filter(pk=unquote(row))
+                    ).initial_forms
+                except (ValueError, TypeError, ValidationError):
+                    forms = ()
+                if not forms:
+                    raise Http404
+                form = forms[0]
+        else:
+            form = self.get_form(request, obj)(instance=obj)
+        field = form.fields.get(field_name)
+        if not isinstance(field, ModelChoiceField) or not self._is_toggled_field(form, field_name):
+            raise Http404
+        return JsonResponse({
+            'choices': [(str(value), str(label)) for value, label in field.choices]
+        })
+
+    def get_toggle_layout_form(self, request, obj=None):
+        """
+        Returns the form class whose toggle groups determine where the
+        metafields are placed. Unless get_form() (or get_formset(), for
+        inlines) has been overridden, this is the declared form class, which
+        avoids building a new form class on every call.
+        """
+        if isinstance(self, InlineModelAdmin):
+            overridden = type(self).get_formset not in (
+                InlineModelAdmin.get_formset, ToggledWidgetAdminMixin.get_formset
+            )
+        else:
+            overridden = type(self).get_form is not ModelAdmin.get_form
+        if overridden or not hasattr(self.form, '_metafield_index'):
+            return self._get_form_for_get_fields(request, obj)
+        return self.form
+
+    @staticmethod
+    def _insert_metafields(field_list, placements):
+        """
+        Returns a copy of the given list of field names with each metafield in
+        the given sequence of (metafield name, field names) pairs inserted
+        after whichever of the corresponding field names appears latest in
+        the list. The fields in the list won't necessarily be in the same
+        order as the fields involved in the toggle group.
+        """
+        positions = {}
+        for index, field_name in enumerate(field_list):
+            if isinstance(field_name, str):
+                positions.setdefault(field_name, index)
+        insertions = {}
+        for metafield, after in placements:
+            try:
+                last_index = max(positions[f] for f in after if f in positions)
+            except ValueError:
                 raise ValueError(
                     'Could not find any of the fields {} in the given list.'.format(
                         ', '.join(after)
                     )
                 )
-            field_list.insert(last_index + 1, metafield)
+            insertions.setdefault(last_index, []).append(metafield)
+        result = []
+        for index, field_name in enumerate(field_list):
+            result.append(field_name)
+            result.extend(insertions.get(index, ()))
+        return result
+
+    @staticmethod
+    def _get_layout_cache_form(form):
+        """
+        Returns the class that defines the given form class' toggle groups.
+        The metafield placement depends only on that class, and unlike a form
+        class built by a form factory, it isn't created anew on each request.
+        """
+        for cls in form.__mro__:
+            if '_metafield_index' in cls.__dict__:
+                return cls
+        return form
 
+    @staticmethod
+    def _freeze_layout(value):
+        if isinstance(value, (list, tuple)):
+            return tuple(ToggledWidgetAdminMixin._freeze_layout(v) for v in value)
+        return value
+
+    @_instrumented(
+        'get_fields', lambda admin, result: {'fields': len(result)},
+        lambda admin: admin.form
+    )
     def get_fields(self, request, obj=None):
-        fields = list(deepcopy(super().get_fields(request, obj)))
-        form = self._get_form_for_get_fields(request, obj)
+        fields = super().get_fields(request, obj)
+        form = self.get_toggle_layout_form(request, obj)
+        # The placement depends only on these, so it can be shared by every
+        # request (and every instance of an inline admin class).
+        cache_key = (
+            'fields', type(self), self._get_layout_cache_form(form), obj is None,
+            self._freeze_layout(fields)
+        )
         try:
-            for group in form.toggle_groups:
-                field_names = [member[0] for member in group]
-                metafield = form._metafield_index[field_names[0]]
-                # If the metafield is already there, remove it so we can
-                # insert it at the proper position.
-                try:
-                    fields.pop(fields.index(metafield))
-                except ValueError:
-                    pass
-                self._insert_metafield(fields, metafield, field_names)
-            return fields
+            return list(_toggle_layout_cache[cache_key])
+        except KeyError:
+            pass
+        try:
+            groups = [[member[0] for member in group] for group in form.toggle_groups]
+            metafields = [form._metafield_index[field_names[0]] for field_names in groups]
         except AttributeError:
             raise SetupIncompleteError(
                 'The metafields do not appear to have been set on {}. '
                 'Does it inherit from ToggledWidgetFormMixin?'.format(form.__name__)
             )
+        # If the metafields are already there, remove them so we can insert
+        # them at the proper positions.
+        metafield_set = set(metafields)
+        fields = self._insert_metafields(
+            [f for f in fields if f not in metafield_set], zip(metafields, groups)
+        )
+        _toggle_layout_cache[cache_key] = tuple(fields)
+        return fields
 
+    @_instrumented(
+        'get_fieldsets', lambda admin, result: {'fieldsets': len(result)},
+        lambda admin: admin.form
+    )
     def get_fieldsets(self, request, obj=None):
-        fieldsets = list(deepcopy(super().get_fieldsets(request, obj)))
+        fieldsets = super().get_fieldsets(request, obj)
+        form = self.get_toggle_layout_form(request, obj)
+        cache_key = (
+            'fieldsets', type(self), self._get_layout_cache_form(form), obj is None,
+            self._freeze_layout([fieldset[1]['fields'] for fieldset in fieldsets])
+        )
+        try:
+            fieldset_fields = _toggle_layout_cache[cache_key]
+        except KeyError:
+            fieldset_fields = _toggle_layout_cache[cache_key] = self._place_fieldset_metafields(
+                fieldsets, form
+            )
+        return [
+            fieldset if fields is None else (fieldset[0], dict(fieldset[1], fields=list(fields)))
+            for fieldset, fields in zip(fieldsets, fieldset_fields)
+        ]
+
+    def _place_fieldset_metafields(self, fieldsets, form):
+        """
+        Returns a tuple containing, for each of the given fieldsets, either
+        the fieldset's new sequence of field names or None if it doesn't need
+        to change.
+        """
         fieldset_index = {}
         fields = set()
-        for fieldset in fieldsets:
+        for index, fieldset in enumerate(fieldsets):
             for field_name in fieldset[1]['fields']:
-                fieldset_index[field_name] = fieldset
+                fieldset_index[field_name] = index
                 fields.add(field_name)
-        form = self._get_form_for_get_fields(request, obj)
+        placements = {}
         try:
             for group in form.toggle_groups:
                 field_names = [member[0] for member in group]
                 metafield = form._metafield_index[field_names[0]]
-                if metafield not in fields:
-                    try:
-                        fieldset = fieldset_index[field_names[0]]
-                        fieldset[1]['fields'] = list(fieldset[1]['fields'])
-                        self._insert_metafield(
-                            fieldset[1]['fields'], metafield, field_names
-                        )
-                    except KeyError:
-                        # The field must have been removed from the fieldset.
-                        # Be agnostic about the validity of that.
-                        pass
+                # If the first field has been removed from the fieldsets, be
+                # agnostic about the validity of that.
+                if metafield not in fields and field_names[0] in fieldset_index:
+                    placements.setdefault(fieldset_index[field_names[0]], []).append(
+                        (metafield, field_names)
+                    )
         except AttributeError:
             raise SetupIncompleteError(
                 'The metafields do not appear to have been set on {}. '
                 'Does it inherit from ToggledWidgetFormMixin, and does it '
                 'define the toggle_groups attribute?'.format(self.form.__name__)
             )
-        return fieldsets
+        return tuple(
+            tuple(self._insert_metafields(fieldset[1]['fields'], placements[index]))
+            if index in placements else None
+            for index, fieldset in enumerate(fieldsets)
+        )
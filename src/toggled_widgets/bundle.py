@@ -0,0 +1,3 @@
+# Generated by scripts/build_bundle.py; do not edit.
+JS = 'admin/js/ToggledWidget.bundle.7ac87bfa8b4b.min.js'
+CSS = 'admin/css/ToggledWidget.bundle.2ba5441e3578.min.css'
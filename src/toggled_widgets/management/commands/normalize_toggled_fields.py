@@ -0,0 +1,154 @@
+from functools import reduce
+from operator import or_
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Max, Min, Q
+from django.utils.module_loading import import_string
+from toggled_widgets import ToggledWidgetFormMixin
+
+class Command(BaseCommand):
+    help = (
+        'Sets empty the stored values of the inactive members of each toggle '
+        'group of the given form class (and those of their cohorts), as the '
+        'form would on saving. As for unbound forms, the active member of a '
+        'group is the last one with a value, or the first one if none have '
+        'values.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'form_class',
+            help='Dotted path to a ModelForm class that uses ToggledWidgetFormMixin.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report the number of rows that would change without changing them.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help='Size of the primary key ranges to update at a time.'
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='The database to use.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            form_class = import_string(options['form_class'])
+        except ImportError as e:
+            raise CommandError(str(e))
+        if not (isinstance(form_class, type) and issubclass(form_class, ToggledWidgetFormMixin)):
+            raise CommandError('{} does not use ToggledWidgetFormMixin.'.format(options['form_class']))
+        try:
+            model = form_class._meta.model
+        except AttributeError:
+            model = None
+        if model is None:
+            raise CommandError('{} is not a ModelForm class.'.format(options['form_class']))
+        if options['chunk_size'] < 1:
+            raise CommandError('The chunk size must be positive.')
+        queryset = model._default_manager.using(options['database'])
+        total = 0
+        for group_plan in form_class.get_toggle_plan().groups:
+            self.stdout.write('{}:'.format(group_plan.metafield_name))
+            for active, filter_q, values in self.get_group_updates(form_class, model, group_plan):
+                conflicting = queryset.filter(filter_q)
+                if options['dry_run']:
+                    count = conflicting.count()
+                else:
+                    count = self.update(conflicting, values, options)
+                total += count
+                self.stdout.write('  {} rows {} with "{}" active'.format(
+                    count, 'to update' if options['dry_run'] else 'updated', active
+                ))
+        self.stdout.write(self.style.SUCCESS('{} {} rows in total.'.format(
+            'Would update' if options['dry_run'] else 'Updated', total
+        )))
+
+    def get_group_updates(self, form_class, model, group_plan):
+        """
+        Yields, for each member of the given group, a tuple of its name, a Q
+        object matching the rows in which it is the active member and any
+        other member or cohort isn't already set to its empty value, and the
+        dict of values to set in those rows. The sets of rows matched for the
+        members of a group are disjoint, and updating them doesn't change
+        which member is active.
+        """
+        model_fields = {}
+        for member in group_plan.members:
+            for field_name in (member.field_name,) + tuple(member.cohorts):
+                model_field = model._meta.get_field(field_name)
+                if not model_field.concrete or model_field.many_to_many:
+                    raise CommandError(
+                        '{} is not stored in the model\'s table.'.format(field_name)
+                    )
+                model_fields[field_name] = model_field
+        empty_q = {
+            field_name: self.get_empty_q(model_field)
+            for field_name, model_field in model_fields.items()
+        }
+        members = group_plan.members
+        for i, member in enumerate(members):
+            # The active member is the last one with a value, so none of the
+            # following members may have one.
+            filter_q = Q()
+            for later_member in members[i + 1:]:
+                filter_q &= empty_q[later_member.field_name]
+            if i:
+                filter_q &= ~empty_q[member.field_name]
+            values = {
+                model_fields[field_name].attname: form_class.get_base_empty_value(field_name)
+                for other in members if other is not member
+                for field_name in (other.field_name,) + tuple(other.cohorts)
+            }
+            filter_q &= reduce(or_, (
+                Q(**{attname + '__isnull': False}) if value is None else ~Q(**{attname: value})
+                for attname, value in values.items()
+            ))
+            yield member.field_name, filter_q, values
+
+    @staticmethod
+    def get_empty_q(model_field):
+        """
+        Returns a Q object matching the rows in which the given field's value
+        is false in Python terms (i.e. null, an empty string, zero or false),
+        which is how forms decide whether a toggled field has a value.
+        """
+        q = Q(**{model_field.attname + '__isnull': True})
+        empty_values = []
+        for value in ('', 0):
+            try:
+                python_value = model_field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                continue
+            if python_value is not None and not python_value and python_value not in empty_values:
+                empty_values.append(python_value)
+        for value in empty_values:
+            q |= Q(**{model_field.attname: value})
+        return q
+
+    def update(self, queryset, values, options):
+        """
+        Updates the rows matched by the given queryset with the given values,
+        in chunks of primary key values if the primary key is an integer, and
+        returns the number of rows updated.
+        """
+        bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+        low, high = bounds['low'], bounds['high']
+        if low is None:
+            return 0
+        if not (isinstance(low, int) and isinstance(high, int)):
+            with transaction.atomic(using=options['database']):
+                return queryset.update(**values)
+        chunk_size = options['chunk_size']
+        count = 0
+        for start in range(low, high + 1, chunk_size):
+            with transaction.atomic(using=options['database']):
+                count += queryset.filter(pk__gte=start, pk__lt=start + chunk_size).update(**values)
+            if options['verbosity'] > 1:
+                self.stdout.write('    {}/{} primary key values scanned, {} rows updated'.format(
+                    min(start + chunk_size, high + 1) - low, high + 1 - low, count
+                ))
+        return count
@@ -1,53 +1,35 @@
+/* Deprecated: nothing in this package uses this class any more, since
+ToggledWidget.js finds the elements of each toggle group from the toggle
+manifests. It is kept for scripts that load it directly and will be removed
+in the next release. */
 class DjangoAdminFieldContext {
     constructor(field) {
+        if (!DjangoAdminFieldContext.warned) {
+            DjangoAdminFieldContext.warned = true;
+            console.warn('DjangoAdminFieldContext is deprecated and will be removed in the next release.');
+        }
         this.field = field;
     }
 
     get row() {
         if (this.field._row === undefined) {
-            let element = this.field;
-            while (element.parentElement) {
-                let className = element.parentElement.getAttribute('class');
-                if (className && className.indexOf('form-row') > -1) {
-                    this.field._row = element.parentElement;
-                    break;
-                }
-                element = element.parentElement;
-            }
+            this.field._row = this.field.closest('.form-row') || undefined;
         }
         return this.field._row;
     }
 
     get fieldset() {
         if (this.field._fieldset === undefined) {
-            let element = this.field;
-            while (element.parentElement) {
-                if (element.parentElement.tagName == 'FIELDSET') {
-                    this.field._fieldset = element.parentElement;
-                    break;
-                }
-                element = element.parentElement;
-            }
+            this.field._fieldset = this.field.closest('fieldset') || undefined;
         }
         return this.field._fieldset;
     }
 
     get prefix() {
         if (this._prefix === undefined) {
-            let element = this.field;
-            while (element.parentElement) {
-                if (element.parentElement.tagName == 'FORM') {
-                    // This field has no prefix
-                    this._prefix = null;
-                    break;
-                }
-                let className = element.parentElement.getAttribute('class');
-                if (className && className.indexOf('inline-related') > -1) {
-                    this._prefix = element.parentElement.id;
-                    break;
-                }
-                element = element.parentElement;
-            }
+            let inline = this.field.closest('.inline-related');
+            // Fields outside of an inline have no prefix
+            this._prefix = inline ? inline.id : null;
         }
         return this._prefix;
     }
@@ -71,4 +53,4 @@ class DjangoAdminFieldContext {
         }
         return name.substr(this.prefix.length + 1);
     }
-}
\ No newline at end of file
+}
@@ -0,0 +1,30 @@
+class ToggledWidget{constructor($,element,fieldName,row,container){this.$=$;this.element=element;this.element.toggler=this;this.fieldName=fieldName;this.row=row;this.container=container||document;this.cohortRows=[];this.group=[this];this.deferred=element.tagName==='TEMPLATE'?[element]:[];}
+show(){if(this.deferred.length){this.materialize();}
+if(this.element.hasAttribute('data-deferred-choices')){this.loadChoices();}
+this.$(this.row).removeClass('hidden');for(let i=0;i<this.cohortRows.length;i++){this.$(this.cohortRows[i]).removeClass('hidden');}
+for(let i=0;i<this.group.length;i++){if(this.group[i]!==this){this.group[i].hide();}}}
+materialize(){let remaining=[];for(let i=0;i<this.deferred.length;i++){let template=this.deferred[i];let name=template.getAttribute('name');let sourceName=template.getAttribute('data-toggle-source');let content;if(sourceName){let source=this.container.querySelector('template.toggle-source[data-toggle-name="'+sourceName+'"]');if(!source){remaining.push(template);continue;}
+content=document.importNode(source.content,true);let parts=sourceName.split('__prefix__');replaceFormPrefix(content,name.slice(parts[0].length,name.length-parts[1].length));}else{content=document.importNode(template.content,true);}
+let element=content.querySelector('[name="'+name+'"]');template.parentNode.replaceChild(content,template);if(template===this.element&&element){this.element=element;this.element.toggler=this;}}
+this.deferred=remaining;}
+loadChoices(){let element=this.element;element.removeAttribute('data-deferred-choices');this.$.getJSON(element.getAttribute('data-toggle-choices-url'),function(data){let selected={};for(let i=0;i<element.options.length;i++){if(element.options[i].selected){selected[element.options[i].value]=true;}}
+let fragment=document.createDocumentFragment();for(let i=0;i<data.choices.length;i++){let value=data.choices[i][0];fragment.appendChild(new Option(data.choices[i][1],value,false,selected[value]===true));}
+while(element.options.length){element.remove(0);}
+element.appendChild(fragment);});}
+hide(){this.$(this.row).addClass('hidden');for(let i=0;i<this.cohortRows.length;i++){this.$(this.cohortRows[i]).addClass('hidden');}}}
+function replaceFormPrefix(fragment,index){let elements=fragment.querySelectorAll('*');for(let i=0;i<elements.length;i++){let attributes=elements[i].attributes;for(let j=0;j<attributes.length;j++){if(attributes[j].value.indexOf('__prefix__')!==-1){attributes[j].value=attributes[j].value.replace(/__prefix__/g,index);}}}}
+const toggleManifests={};function initializeToggleGroups($,groups,prefix,container){let getElement=function(name){let elements=document.getElementsByName(prefix?prefix+'-'+name:name);for(let i=0;i<elements.length;i++){if(!container||container.contains(elements[i])){return elements[i];}}
+return null;};for(let i=0;i<groups.length;i++){let metafield=getElement(groups[i][0]);if(!metafield){continue;}
+let members=groups[i][1];let togglers=[];metafield.togglers={};for(let j=0;j<members.length;j++){let fieldName=members[j][0];let element=getElement(fieldName);if(!element){continue;}
+let toggler=new ToggledWidget($,element,fieldName,element.closest('.form-row'),container);for(let k=0;k<members[j][1].length;k++){let cohort=getElement(members[j][1][k]);if(cohort){toggler.cohortRows.push(cohort.closest('.form-row'));if(cohort.tagName==='TEMPLATE'){toggler.deferred.push(cohort);}}}
+toggler.group=togglers;togglers.push(toggler);metafield.togglers[fieldName]=toggler;}}}
+function initializeToggleManifests(container){let scripts=container.querySelectorAll('script.toggle-manifest');for(let i=0;i<scripts.length;i++){let manifest=JSON.parse(scripts[i].textContent);let key=manifest.prefix||'';if(!(key in toggleManifests)){toggleManifests[key]={prefix:manifest.prefix,formset:manifest.formset,groups:[],metafields:{}};}
+let merged=toggleManifests[key];for(let j=0;j<manifest.groups.length;j++){let group=manifest.groups[j];if(merged.metafields[group[0]]!==true){merged.metafields[group[0]]=true;merged.groups.push(group);}}}}
+function initializeMetafield($,metafield){if(metafield.togglers){return true;}
+let name=metafield.name;for(let key in toggleManifests){let manifest=toggleManifests[key];let prefix=manifest.prefix;let fieldName=name;if(prefix){if(name.indexOf(prefix+'-')!==0){continue;}
+fieldName=name.slice(prefix.length+1);if(manifest.formset){let separator=fieldName.indexOf('-');if(separator===-1){continue;}
+prefix+='-'+fieldName.slice(0,separator);fieldName=fieldName.slice(separator+1);}}
+if(manifest.metafields[fieldName]===true){initializeToggleGroups($,manifest.groups,prefix,metafield.form);return Boolean(metafield.togglers);}}
+return false;}
+function delegateMetafieldEvents($){$(document).on('change','.toggle-metafield',function(){let toggler=initializeMetafield($,this)&&this.togglers[this.value];if(toggler){toggler.show();}});$(document).on('mousedown','.toggle-metafield.toggle-button',function(e){if(e.which==1){e.preventDefault();this.selectedIndex=this.selectedIndex?0:1;$(this).change();}});};
+(function($){$(function(){delegateMetafieldEvents($);initializeToggleManifests(document);});})(django.jQuery);
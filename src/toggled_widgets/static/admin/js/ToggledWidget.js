@@ -1,49 +1,100 @@
 class ToggledWidget {
-    constructor($, element) {
+    constructor($, element, fieldName, row, container) {
         this.$ = $;
         this.element = element;
         this.element.toggler = this;
-        this.fieldName = this.element.getAttribute('name');
-        let context = new DjangoAdminFieldContext(this.element);
-        this.row = context.row;
-        let toggleId = this.element.getAttribute('data-toggle-id');
-        let $fieldset = this.$(context.fieldset);
+        this.fieldName = fieldName;
+        this.row = row;
+        // The element (usually the form) within which related elements are found
+        this.container = container || document;
         /* We don't actually care about the cohort fields, just the rows in
         which they appear. */
-        let cohortRows = [];
-        $fieldset.find(
-            '[data-master-toggle-id=' + toggleId + ']'
-        ).each(function() {
-            let context = new DjangoAdminFieldContext(this);
-            cohortRows.push(context.row);
-        });
-        this.cohortRows = cohortRows;
-        let selector = '[data-toggle-group-id=' + this.element.getAttribute('data-toggle-group-id') + ']' +
-            // But not this one
-            ':not([data-toggle-id="' + toggleId + '"])' +
-            // And also not the metafield
-            ':not(.toggle-metafield)';
-        this.others = this.$(context.fieldset).find(selector).get();
-        let fieldsetContainerId = context.fieldset.parentElement.id;
-        /* If the parent of the fieldset has an id attribute, and it ends with
-        a hyphen followed by a number, we're in an inline context. We'll need
-        to chop the contents of that id off the field's name attribute to get
-        the clean name. */
-        if (fieldsetContainerId && /-\d+$/.test(fieldsetContainerId)) {
-            this.fieldName = this.fieldName.substr(fieldsetContainerId.length + 1);
-        }
+        this.cohortRows = [];
+        // The togglers in this widget's group, including this one
+        this.group = [this];
+        /* The <template> elements that were rendered in place of this widget
+        and its cohorts while they were hidden */
+        this.deferred = element.tagName === 'TEMPLATE' ? [element] : [];
     }
 
     show() {
+        if (this.deferred.length) {
+            this.materialize();
+        }
+        if (this.element.hasAttribute('data-deferred-choices')) {
+            this.loadChoices();
+        }
         this.$(this.row).removeClass('hidden');
         for (let i = 0; i < this.cohortRows.length; i++) {
             this.$(this.cohortRows[i]).removeClass('hidden');
         }
-        for (let i = 0; i < this.others.length; i++) {
-            this.others[i].toggler.hide();
+        for (let i = 0; i < this.group.length; i++) {
+            if (this.group[i] !== this) {
+                this.group[i].hide();
+            }
         }
     }
 
+    /* Replaces the deferred <template> elements with the widgets they stand
+    for. An empty template refers to the source template that a formset's
+    empty form rendered for the equivalent widget. */
+    materialize() {
+        let remaining = [];
+        for (let i = 0; i < this.deferred.length; i++) {
+            let template = this.deferred[i];
+            let name = template.getAttribute('name');
+            let sourceName = template.getAttribute('data-toggle-source');
+            let content;
+            if (sourceName) {
+                let source = this.container.querySelector(
+                    'template.toggle-source[data-toggle-name="' + sourceName + '"]'
+                );
+                if (!source) {
+                    remaining.push(template);
+                    continue;
+                }
+                content = document.importNode(source.content, true);
+                let parts = sourceName.split('__prefix__');
+                replaceFormPrefix(content, name.slice(parts[0].length, name.length - parts[1].length));
+            } else {
+                content = document.importNode(template.content, true);
+            }
+            let element = content.querySelector('[name="' + name + '"]');
+            template.parentNode.replaceChild(content, template);
+            if (template === this.element && element) {
+                this.element = element;
+                this.element.toggler = this;
+            }
+        }
+        this.deferred = remaining;
+    }
+
+    /* Replaces the placeholder options of a select element whose choices were
+    deferred on the server with the full list, preserving the selection. */
+    loadChoices() {
+        let element = this.element;
+        element.removeAttribute('data-deferred-choices');
+        this.$.getJSON(element.getAttribute('data-toggle-choices-url'), function(data) {
+            let selected = {};
+            for (let i = 0; i < element.options.length; i++) {
+                if (element.options[i].selected) {
+                    selected[element.options[i].value] = true;
+                }
+            }
+            let fragment = document.createDocumentFragment();
+            for (let i = 0; i < data.choices.length; i++) {
+                let value = data.choices[i][0];
+                fragment.appendChild(new Option(
+                    data.choices[i][1], value, false, selected[value] === true
+                ));
+            }
+            while (element.options.length) {
+                element.remove(0);
+            }
+            element.appendChild(fragment);
+        });
+    }
+
     hide() {
         this.$(this.row).addClass('hidden');
         for (let i = 0; i < this.cohortRows.length; i++) {
@@ -52,30 +103,150 @@ class ToggledWidget {
     }
 }
 
-function initializeMetafield(field) {
-    let optionsByValue = {};
-    for (let i = 0; i < field.options.length; i++) {
-        optionsByValue[field.options[i].value] = field.options[i];
+/* Replaces the "__prefix__" placeholder that the admin uses for the index of
+a formset's empty form with the given index in the attributes of every element
+in the given fragment. */
+function replaceFormPrefix(fragment, index) {
+    let elements = fragment.querySelectorAll('*');
+    for (let i = 0; i < elements.length; i++) {
+        let attributes = elements[i].attributes;
+        for (let j = 0; j < attributes.length; j++) {
+            if (attributes[j].value.indexOf('__prefix__') !== -1) {
+                attributes[j].value = attributes[j].value.replace(/__prefix__/g, index);
+            }
+        }
     }
-    // Make sure this stays within the context of the fieldset
-    let context = new DjangoAdminFieldContext(field);
-    django.jQuery(context.fieldset).find(
-        '[data-toggle-group-id=' + field.getAttribute('data-toggle-group-id') + '].toggled-widget:not(.toggle-metafield)'
-    ).each(function() {
-        optionsByValue[this.toggler.fieldName].toggler = this.toggler;
-    });
-    django.jQuery(field).on('change', function() {
-        this.options[this.selectedIndex].toggler.show();
-    });
-    if (field.getAttribute('class').indexOf('toggle-button') > -1) {
-        django.jQuery(field).on('mousedown', function(e) {
-            if (e.which == 1) {
-                e.preventDefault();
-                /* The only two possible values for the selected index should be 0
-                and 1. */
-                this.selectedIndex = this.selectedIndex ? 0 : 1;
-                django.jQuery(this).change();
+}
+
+// Toggle manifests that have been read, keyed by prefix
+const toggleManifests = {};
+
+/* Creates the ToggledWidget instances for the form whose field names have the
+given prefix (which may be null) and ties each metafield to the togglers in
+its group, according to the groups listed in the form's toggle manifest. Only
+elements within the given container (if any) are considered, so that other
+forms on the page with the same prefix don't interfere. */
+function initializeToggleGroups($, groups, prefix, container) {
+    let getElement = function(name) {
+        let elements = document.getElementsByName(prefix ? prefix + '-' + name : name);
+        for (let i = 0; i < elements.length; i++) {
+            if (!container || container.contains(elements[i])) {
+                return elements[i];
             }
-        });
+        }
+        return null;
+    };
+    for (let i = 0; i < groups.length; i++) {
+        let metafield = getElement(groups[i][0]);
+        if (!metafield) {
+            continue;
+        }
+        let members = groups[i][1];
+        let togglers = [];
+        metafield.togglers = {};
+        for (let j = 0; j < members.length; j++) {
+            let fieldName = members[j][0];
+            let element = getElement(fieldName);
+            if (!element) {
+                continue;
+            }
+            let toggler = new ToggledWidget(
+                $, element, fieldName, element.closest('.form-row'), container
+            );
+            for (let k = 0; k < members[j][1].length; k++) {
+                let cohort = getElement(members[j][1][k]);
+                if (cohort) {
+                    toggler.cohortRows.push(cohort.closest('.form-row'));
+                    if (cohort.tagName === 'TEMPLATE') {
+                        toggler.deferred.push(cohort);
+                    }
+                }
+            }
+            toggler.group = togglers;
+            togglers.push(toggler);
+            metafield.togglers[fieldName] = toggler;
+        }
+    }
+}
+
+/* Reads the toggle manifests within the given container. Each one describes
+one or more of a form's groups, and those with the same prefix are merged. The
+forms they describe aren't initialized until one of their metafields is used;
+until then, the visibility of the fields is as rendered on the server. */
+function initializeToggleManifests(container) {
+    let scripts = container.querySelectorAll('script.toggle-manifest');
+    for (let i = 0; i < scripts.length; i++) {
+        let manifest = JSON.parse(scripts[i].textContent);
+        let key = manifest.prefix || '';
+        if (!(key in toggleManifests)) {
+            toggleManifests[key] = {
+                prefix: manifest.prefix,
+                formset: manifest.formset,
+                groups: [],
+                metafields: {}
+            };
+        }
+        let merged = toggleManifests[key];
+        for (let j = 0; j < manifest.groups.length; j++) {
+            let group = manifest.groups[j];
+            if (merged.metafields[group[0]] !== true) {
+                merged.metafields[group[0]] = true;
+                merged.groups.push(group);
+            }
+        }
+    }
+}
+
+/* Initializes the form containing the given metafield, if it hasn't been
+already, and returns whether the metafield has togglers. A formset's manifest
+applies to each of its forms, including those added on the client side. */
+function initializeMetafield($, metafield) {
+    if (metafield.togglers) {
+        return true;
+    }
+    let name = metafield.name;
+    for (let key in toggleManifests) {
+        let manifest = toggleManifests[key];
+        let prefix = manifest.prefix;
+        let fieldName = name;
+        if (prefix) {
+            if (name.indexOf(prefix + '-') !== 0) {
+                continue;
+            }
+            fieldName = name.slice(prefix.length + 1);
+            if (manifest.formset) {
+                let separator = fieldName.indexOf('-');
+                if (separator === -1) {
+                    continue;
+                }
+                prefix += '-' + fieldName.slice(0, separator);
+                fieldName = fieldName.slice(separator + 1);
+            }
+        }
+        if (manifest.metafields[fieldName] === true) {
+            initializeToggleGroups($, manifest.groups, prefix, metafield.form);
+            return Boolean(metafield.togglers);
+        }
     }
+    return false;
+}
+
+/* Handles metafield events for the whole document, so that no per-element
+handlers need to be bound. */
+function delegateMetafieldEvents($) {
+    $(document).on('change', '.toggle-metafield', function() {
+        let toggler = initializeMetafield($, this) && this.togglers[this.value];
+        if (toggler) {
+            toggler.show();
+        }
+    });
+    $(document).on('mousedown', '.toggle-metafield.toggle-button', function(e) {
+        if (e.which == 1) {
+            e.preventDefault();
+            /* The only two possible values for the selected index should be 0
+            and 1. */
+            this.selectedIndex = this.selectedIndex ? 0 : 1;
+            $(this).change();
+        }
+    });
 }
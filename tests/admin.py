@@ -0,0 +1,50 @@
+from django.contrib import admin
+from django.forms import ModelForm
+from toggled_widgets import ToggledWidgetAdminMixin, ToggledWidgetFormMixin
+from .models import Record, RecordItem, Target
+
+site = admin.AdminSite(name='tests')
+
+class RecordForm(ToggledWidgetFormMixin, ModelForm):
+    """
+    Form whose first target can't be the same as the second one, once saved.
+    """
+    toggle_groups = [('first_target', 'second_target')]
+
+    class Meta:
+        model = Record
+        fields = '__all__'
+
+    def __modify_fields__(self, *args, **kwargs):
+        if self.instance.pk:
+            self.fields['first_target'].queryset = Target.objects.exclude(
+                pk=self.instance.second_target_id
+            )
+
+class RecordItemForm(ToggledWidgetFormMixin, ModelForm):
+    """
+    Form whose second target can't be the same as the first one, once saved.
+    """
+    toggle_groups = [('first_target', 'second_target')]
+
+    class Meta:
+        model = RecordItem
+        fields = '__all__'
+
+    def __modify_fields__(self, *args, **kwargs):
+        if self.instance.pk:
+            self.fields['second_target'].queryset = Target.objects.exclude(
+                pk=self.instance.first_target_id
+            )
+
+class RecordItemInline(ToggledWidgetAdminMixin, admin.TabularInline):
+    model = RecordItem
+    form = RecordItemForm
+    defer_hidden_choices = True
+    extra = 1
+
+@admin.register(Record, site=site)
+class RecordAdmin(ToggledWidgetAdminMixin, admin.ModelAdmin):
+    form = RecordForm
+    inlines = [RecordItemInline]
+    defer_hidden_choices = True
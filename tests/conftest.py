@@ -0,0 +1,22 @@
+import os
+import django
+import pytest
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+django.setup()
+
+@pytest.fixture(scope='session', autouse=True)
+def django_test_environment():
+    """
+    Sets up the test environment and databases once for the whole session,
+    as Django's own test runner would, so that the suite can run under plain
+    pytest.
+    """
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    yield
+    runner.teardown_databases(old_config)
+    teardown_test_environment()
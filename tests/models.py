@@ -0,0 +1,51 @@
+from django.db import models
+
+class Target(models.Model):
+    """
+    Model that toggled foreign keys point to.
+    """
+    name = models.CharField(max_length=50)
+
+    def __str__(self):
+        return self.name
+
+class Record(models.Model):
+    """
+    Model whose toggled fields are foreign keys.
+    """
+    first_target = models.ForeignKey(
+        Target, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    second_target = models.ForeignKey(
+        Target, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+
+class RecordItem(models.Model):
+    """
+    Inline child of Record with the same toggled foreign keys.
+    """
+    record = models.ForeignKey(Record, on_delete=models.CASCADE, related_name='items')
+    first_target = models.ForeignKey(
+        Target, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    second_target = models.ForeignKey(
+        Target, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+
+class Note(models.Model):
+    """
+    Model with character fields to be toggled.
+    """
+    text = models.CharField(max_length=50, blank=True)
+    text_detail = models.CharField(max_length=50, blank=True)
+    url = models.CharField(max_length=50, blank=True)
+    reference = models.CharField(max_length=50, blank=True)
+
+class DefaultNote(models.Model):
+    """
+    Model with character fields to be toggled that have defaults, which forms
+    leave alone when the fields aren't submitted.
+    """
+    text = models.CharField(max_length=50, blank=True, default='')
+    url = models.CharField(max_length=50, blank=True, default='https://')
+    published = models.DateField(null=True, blank=True)
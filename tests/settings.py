@@ -0,0 +1,27 @@
+"""
+Minimal Django settings for the test suite.
+"""
+SECRET_KEY = 'tests'
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'toggled_widgets',
+    'tests'
+]
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:'
+    }
+}
+TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'APP_DIRS': True
+}]
+ROOT_URLCONF = 'tests.urls'
+STATIC_URL = '/static/'
+USE_TZ = True
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
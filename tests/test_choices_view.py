@@ -0,0 +1,101 @@
+import json
+import re
+from html import unescape
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+from django.urls import resolve
+from .admin import site
+from .models import Record, RecordItem, Target
+
+def get_choices_url(html):
+    return unescape(re.search(r'data-toggle-choices-url="([^"]*)"', html).group(1))
+
+class ToggledChoicesViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.targets = Target.objects.bulk_create([
+            Target(name='Target {}'.format(i)) for i in range(5)
+        ])
+        cls.record = Record.objects.create(second_target=cls.targets[1])
+        cls.item = RecordItem.objects.create(record=cls.record, first_target=cls.targets[2])
+
+    def setUp(self):
+        self.model_admin = site._registry[Record]
+
+    def get_request(self, url='/', user=None):
+        request = RequestFactory().get(url)
+        request.user = user or self.user
+        return request
+
+    def get_choices(self, url, user=None):
+        request = self.get_request(url, user)
+        match = resolve(request.path)
+        response = match.func(request, *match.args, **match.kwargs)
+        self.assertEqual(response.status_code, 200)
+        return [value for value, label in json.loads(response.content)['choices']]
+
+    def get_inline_formset(self, obj):
+        request = self.get_request()
+        inline = self.model_admin.get_inline_instances(request, obj)[0]
+        return inline.get_formset(request, obj)(instance=obj)
+
+    def test_object_choices(self):
+        form = self.model_admin.get_form(self.get_request(), self.record)(instance=self.record)
+        url = get_choices_url(str(form['first_target']))
+        self.assertEqual(
+            self.get_choices(url),
+            [''] + [str(t.pk) for t in self.targets if t != self.targets[1]]
+        )
+
+    def test_add_form_choices(self):
+        form = self.model_admin.get_form(self.get_request())()
+        url = get_choices_url(str(form['second_target']))
+        self.assertEqual(self.get_choices(url), [''] + [str(t.pk) for t in self.targets])
+
+    def test_inline_row_choices(self):
+        form = self.get_inline_formset(self.record).forms[0]
+        url = get_choices_url(str(form['second_target']))
+        self.assertIn('inline=tests.recorditem', url)
+        self.assertEqual(
+            self.get_choices(url),
+            [''] + [str(t.pk) for t in self.targets if t != self.targets[2]]
+        )
+
+    def test_inline_empty_form_choices(self):
+        form = self.get_inline_formset(self.record).empty_form
+        url = get_choices_url(str(form['second_target']))
+        self.assertEqual(self.get_choices(url), [''] + [str(t.pk) for t in self.targets])
+
+    def test_deferred_rendering_is_query_free(self):
+        form = self.model_admin.get_form(self.get_request(), self.record)(instance=self.record)
+        with self.assertNumQueries(0):
+            html = str(form['first_target'])
+        self.assertIn('data-deferred-choices', html)
+
+    def test_permission_denied(self):
+        user = User.objects.create_user('staff', password='password', is_staff=True)
+        request = self.get_request(user=user)
+        with self.assertRaises(PermissionDenied):
+            self.model_admin.toggled_choices_view(request, 'first_target')
+        request = self.get_request('/?row={}'.format(self.record.pk), user)
+        with self.assertRaises(PermissionDenied):
+            self.model_admin.toggled_choices_view(request, 'first_target')
+
+    def test_not_found(self):
+        for field_name, query_string in (
+            ('first_target', '?row=999'),
+            ('first_target', '?row=x'),
+            ('items', ''),
+            ('missing', ''),
+            ('second_target', '?inline=tests.note'),
+            ('second_target', '?inline=tests.recorditem&object_id={}&row=999'.format(self.record.pk)),
+            ('second_target', '?inline=tests.recorditem&object_id=999'),
+        ):
+            with self.subTest(field_name=field_name, query_string=query_string):
+                with self.assertRaises(Http404):
+                    self.model_admin.toggled_choices_view(
+                        self.get_request('/' + query_string), field_name
+                    )
@@ -0,0 +1,129 @@
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.forms import Form, ModelForm
+from django.test import TestCase
+from toggled_widgets import ToggledWidgetFormMixin
+from .models import Note, Record, Target
+
+class NoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [(('text', 'text_detail'), 'url')]
+
+    class Meta:
+        model = Note
+        fields = '__all__'
+
+class RecordForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('first_target', 'second_target')]
+
+    class Meta:
+        model = Record
+        fields = '__all__'
+
+class PlainForm(ToggledWidgetFormMixin, Form):
+    toggle_groups = []
+
+class UserForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('first_name', 'groups')]
+
+    class Meta:
+        model = User
+        fields = ('first_name', 'groups')
+
+def normalize(form_class, **options):
+    stdout = StringIO()
+    call_command(
+        'normalize_toggled_fields', 'tests.test_commands.' + form_class.__name__,
+        stdout=stdout, **options
+    )
+    return stdout.getvalue()
+
+class NormalizeToggledFieldsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.notes = Note.objects.bulk_create([
+            # The last member with a value is the active one.
+            Note(text='a', text_detail='b', url='c', reference='d'),
+            Note(text='a', text_detail='b', reference='d'),
+            Note(text_detail='b', url='c'),
+            Note(url='c'),
+            Note(),
+        ])
+        targets = Target.objects.bulk_create([Target(name='First'), Target(name='Second')])
+        cls.records = Record.objects.bulk_create([
+            Record(first_target=targets[0], second_target=targets[1]),
+            Record(first_target=targets[0]),
+            Record(second_target=targets[1]),
+        ])
+
+    def get_notes(self):
+        return list(Note.objects.order_by('pk').values_list(
+            'text', 'text_detail', 'url', 'reference'
+        ))
+
+    def test_dry_run(self):
+        before = self.get_notes()
+        output = normalize(NoteForm, dry_run=True)
+        self.assertIn('  0 rows to update with "text" active', output)
+        self.assertIn('  2 rows to update with "url" active', output)
+        self.assertIn('Would update 2 rows in total.', output)
+        self.assertEqual(self.get_notes(), before)
+
+    def test_character_fields(self):
+        output = normalize(NoteForm)
+        self.assertIn('text_metafield:', output)
+        self.assertIn('Updated 2 rows in total.', output)
+        self.assertEqual(self.get_notes(), [
+            ('', '', 'c', 'd'),
+            # The active member's cohort keeps its value.
+            ('a', 'b', '', 'd'),
+            ('', '', 'c', ''),
+            ('', '', 'c', ''),
+            ('', '', '', ''),
+        ])
+
+    def test_foreign_keys(self):
+        output = normalize(RecordForm)
+        self.assertIn('Updated 1 rows in total.', output)
+        self.assertEqual(
+            list(Record.objects.order_by('pk').values_list('first_target', 'second_target')),
+            [
+                (None, self.records[0].second_target_id),
+                (self.records[1].first_target_id, None),
+                (None, self.records[2].second_target_id),
+            ]
+        )
+
+    def test_chunks_with_progress(self):
+        output = normalize(NoteForm, chunk_size=1, verbosity=2)
+        progress = [line.strip() for line in output.splitlines() if 'scanned' in line]
+        # Only the range of primary keys of the rows to update is scanned.
+        self.assertEqual(progress, [
+            '1/3 primary key values scanned, 1 rows updated',
+            '2/3 primary key values scanned, 1 rows updated',
+            '3/3 primary key values scanned, 2 rows updated',
+        ])
+        self.assertIn('Updated 2 rows in total.', output)
+
+    def test_second_run_changes_nothing(self):
+        normalize(NoteForm)
+        normalize(RecordForm)
+        self.assertIn('Updated 0 rows in total.', normalize(NoteForm))
+        self.assertIn('Updated 0 rows in total.', normalize(RecordForm))
+        self.assertIn('Would update 0 rows in total.', normalize(NoteForm, dry_run=True))
+
+    def test_not_a_model_form(self):
+        with self.assertRaisesMessage(CommandError, 'is not a ModelForm class'):
+            normalize(PlainForm)
+
+    def test_not_a_toggled_form(self):
+        with self.assertRaisesMessage(CommandError, 'does not use ToggledWidgetFormMixin'):
+            call_command('normalize_toggled_fields', 'django.forms.Form', stdout=StringIO())
+
+    def test_many_to_many_member(self):
+        with self.assertRaisesMessage(CommandError, "groups is not stored in the model's table"):
+            normalize(UserForm)
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaisesMessage(CommandError, 'The chunk size must be positive.'):
+            normalize(NoteForm, chunk_size=0)
@@ -0,0 +1,121 @@
+from html.parser import HTMLParser
+from django.contrib.admin.widgets import AdminDateWidget
+from django.forms import HiddenInput, ModelForm
+from django.forms.models import BaseModelFormSet, modelformset_factory
+from django.test import TestCase
+from toggled_widgets import ToggledWidgetFormMixin, ToggledWidgetFormSetMixin
+from .models import DefaultNote, Note
+
+class NoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [(('text', 'text_detail'), 'url')]
+    defer_hidden_widgets = True
+
+    class Meta:
+        model = Note
+        fields = ('text', 'text_detail', 'url')
+        widgets = {'text_detail': HiddenInput}
+
+class DefaultNoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('text', ('url', 'published'))]
+    defer_hidden_widgets = True
+
+    class Meta:
+        model = DefaultNote
+        fields = '__all__'
+        widgets = {'published': AdminDateWidget}
+
+class SubmittedDataParser(HTMLParser):
+    """
+    Collects the data that a browser would submit for the form controls in
+    the fed HTML, which excludes the contents of <template> elements.
+    """
+    def __init__(self):
+        super().__init__()
+        self.data = {}
+        self._template_depth = 0
+        self._select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'template':
+            self._template_depth += 1
+        elif self._template_depth:
+            return
+        elif tag == 'input':
+            self.data[attrs['name']] = attrs.get('value', '')
+        elif tag == 'select':
+            self._select = attrs['name']
+        elif tag == 'option' and self._select and 'selected' in attrs:
+            self.data[self._select] = attrs['value']
+
+    def handle_endtag(self, tag):
+        if tag == 'template':
+            self._template_depth -= 1
+        elif tag == 'select':
+            self._select = None
+
+def get_submitted_data(html):
+    parser = SubmittedDataParser()
+    parser.feed(html)
+    return parser.data
+
+class DeferralTestCase(TestCase):
+    def test_hidden_input_cohort_of_active_member_is_submitted(self):
+        note = Note.objects.create(text='text', text_detail='secret')
+        html = str(NoteForm(instance=note))
+        data = get_submitted_data(html)
+        self.assertEqual(data['text_detail'], 'secret')
+        # The inactive member is deferred and not submitted.
+        self.assertNotIn('url', data)
+        self.assertIn('<template class="toggle-deferred" name="url">', html)
+        form = NoteForm(data, instance=note)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        note.refresh_from_db()
+        self.assertEqual((note.text, note.text_detail, note.url), ('text', 'secret', ''))
+
+    def test_hidden_input_cohort_of_inactive_member_is_deferred(self):
+        note = Note.objects.create(url='url')
+        html = str(NoteForm(instance=note))
+        data = get_submitted_data(html)
+        self.assertNotIn('text', data)
+        self.assertNotIn('text_detail', data)
+        self.assertIn('<template class="toggle-deferred" name="text_detail">', html)
+
+    def test_deferred_inactive_fields_with_defaults_are_cleared(self):
+        note = DefaultNote.objects.create(text='stale', url='b')
+        html = str(DefaultNoteForm(instance=note))
+        data = get_submitted_data(html)
+        self.assertNotIn('text', data)
+        self.assertEqual(data['text_metafield'], 'url')
+        form = DefaultNoteForm(data, instance=note)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        note.refresh_from_db()
+        self.assertEqual((note.text, note.url), ('', 'b'))
+
+    def test_widgets_with_scripts_are_not_deferred(self):
+        html = str(DefaultNoteForm(instance=DefaultNote(text='text', url='')))
+        self.assertIn('<template class="toggle-deferred" name="url">', html)
+        self.assertNotIn('<template class="toggle-deferred" name="published">', html)
+        self.assertIn('name="published"', html)
+
+    def test_sources_only_for_empty_initial_values(self):
+        DefaultNote.objects.bulk_create([DefaultNote(text='text', url='')] * 2)
+        formset_class = modelformset_factory(
+            DefaultNote, form=DefaultNoteForm, extra=0,
+            formset=ToggledWidgetFormSetMixin.mix_into(
+                BaseModelFormSet, defer_to_empty_form=True
+            )
+        )
+        formset = formset_class(queryset=DefaultNote.objects.order_by('pk'))
+        html = ''.join(str(form) for form in formset) + str(formset.empty_form)
+        # The empty form's URL is the model default, so the rows can't copy
+        # it; they render their own empty widgets instead.
+        self.assertNotIn('data-toggle-source="form-__prefix__-url"', html)
+        self.assertNotIn('class="toggle-source" data-toggle-name="form-__prefix__-url"', html)
+        for form in formset:
+            self.assertIn(
+                '<template class="toggle-deferred" name="{}"><input'.format(form['url'].html_name),
+                html
+            )
@@ -0,0 +1,55 @@
+from django.forms import ModelForm
+from django.forms.models import BaseInlineFormSet, inlineformset_factory
+from django.test import TestCase
+from toggled_widgets import ToggledWidgetFormMixin, ToggledWidgetFormSetMixin
+from .models import Record, RecordItem, Target
+
+class RecordItemForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('first_target', 'second_target')]
+
+    class Meta:
+        model = RecordItem
+        fields = '__all__'
+
+class RowTargetRecordItemForm(RecordItemForm):
+    """
+    Form that limits the choices of each row to the target it points to.
+    """
+    def __modify_fields__(self, *args, **kwargs):
+        if self.instance.pk:
+            self.fields['second_target'].queryset = Target.objects.filter(
+                pk=self.instance.second_target_id
+            )
+
+class SharedChoicesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.targets = Target.objects.bulk_create([
+            Target(name='Target {}'.format(i)) for i in range(5)
+        ])
+        cls.record = Record.objects.create()
+        RecordItem.objects.bulk_create([
+            RecordItem(record=cls.record, second_target=target) for target in cls.targets
+        ])
+
+    def get_formset(self, form):
+        formset_class = inlineformset_factory(
+            Record, RecordItem, form=form, extra=0,
+            formset=ToggledWidgetFormSetMixin.mix_into(BaseInlineFormSet)
+        )
+        return formset_class(instance=self.record, queryset=RecordItem.objects.order_by('pk'))
+
+    def test_choices_evaluated_once(self):
+        formset = self.get_formset(RecordItemForm)
+        formset.forms
+        # One query for each toggled field, however many rows there are
+        with self.assertNumQueries(2):
+            html = str(formset)
+        self.assertEqual(html.count('>Target 4</option>'), 2 * len(self.targets))
+
+    def test_modified_querysets_not_shared(self):
+        formset = self.get_formset(RowTargetRecordItemForm)
+        for form, target in zip(formset.forms, self.targets):
+            html = str(form['second_target'])
+            self.assertIn('>{}</option>'.format(target), html)
+            self.assertEqual(html.count('</option>'), 2)
@@ -0,0 +1,157 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.forms import ModelForm
+from django.test import RequestFactory, TestCase
+import toggled_widgets
+from toggled_widgets import ToggledWidgetAdminMixin, ToggledWidgetFormMixin
+from .admin import RecordItemForm
+from .models import Note, Record, RecordItem
+
+class NoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('text', 'url'), ('text_detail', 'reference')]
+
+    class Meta:
+        model = Note
+        fields = '__all__'
+
+class ReferenceNoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('url', 'reference')]
+
+    class Meta:
+        model = Note
+        fields = '__all__'
+
+def get_uncached_fields(model_admin, request, obj=None):
+    """
+    Places the metafields in the admin's fields without the layout cache or
+    the get_toggle_layout_form() shortcut.
+    """
+    fields = list(super(ToggledWidgetAdminMixin, model_admin).get_fields(request, obj))
+    form = model_admin._get_form_for_get_fields(request, obj)
+    for group in form.toggle_groups:
+        metafield = form._metafield_index[group[0][0]]
+        if metafield in fields:
+            fields.remove(metafield)
+        insert_after(fields, metafield, [member[0] for member in group])
+    return fields
+
+def get_uncached_fieldsets(model_admin, request, obj=None):
+    fieldsets = [
+        (name, dict(options, fields=list(options['fields'])))
+        for name, options in super(ToggledWidgetAdminMixin, model_admin).get_fieldsets(request, obj)
+    ]
+    form = model_admin._get_form_for_get_fields(request, obj)
+    for group in form.toggle_groups:
+        metafield = form._metafield_index[group[0][0]]
+        for name, options in fieldsets:
+            if metafield in options['fields']:
+                break
+        else:
+            for name, options in fieldsets:
+                if group[0][0] in options['fields']:
+                    insert_after(options['fields'], metafield, [member[0] for member in group])
+    return fieldsets
+
+def insert_after(field_list, metafield, field_names):
+    index = max(i for i, field_name in enumerate(field_list) if field_name in field_names)
+    field_list.insert(index + 1, metafield)
+
+class NoteAdmin(ToggledWidgetAdminMixin, admin.ModelAdmin):
+    form = NoteForm
+
+class DeclaredFieldsNoteAdmin(NoteAdmin):
+    fields = ['reference', ('text', 'text_detail'), 'url']
+
+class FirstIndexNoteAdmin(NoteAdmin):
+    # Only one field of the group is present, at the first index.
+    fields = ['url', 'text', 'text_detail']
+    form = ReferenceNoteForm
+
+class FieldsetsNoteAdmin(NoteAdmin):
+    fieldsets = [
+        (None, {'fields': ['text', 'text_detail_metafield']}),
+        ('More', {'fields': [('url', 'reference'), 'text_detail']})
+    ]
+
+class ReadOnlyNoteAdmin(NoteAdmin):
+    def get_readonly_fields(self, request, obj=None):
+        return ['text'] if obj else []
+
+class FormOverrideNoteAdmin(NoteAdmin):
+    def get_form(self, request, obj=None, **kwargs):
+        if obj is not None:
+            kwargs['form'] = ReferenceNoteForm
+        return super().get_form(request, obj, **kwargs)
+
+class RecordItemInline(ToggledWidgetAdminMixin, admin.StackedInline):
+    model = RecordItem
+    form = RecordItemForm
+    fields = ['second_target', 'record', 'first_target']
+
+class FieldsetsRecordItemInline(RecordItemInline):
+    fields = None
+    fieldsets = [(None, {'fields': [('first_target', 'second_target')]})]
+
+class LayoutCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.note = Note.objects.create(url='x')
+        cls.record = Record.objects.create()
+
+    def setUp(self):
+        toggled_widgets._toggle_layout_cache.clear()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+        self.site = admin.AdminSite(name='layout')
+
+    def assertLayoutUncached(self, model_admin, obj):
+        # The first call for each view fills the cache, the second reads it.
+        for i in range(2):
+            for view_obj in (None, obj):
+                with self.subTest(admin=type(model_admin).__name__, call=i, add=view_obj is None):
+                    self.assertEqual(
+                        model_admin.get_fields(self.request, view_obj),
+                        get_uncached_fields(model_admin, self.request, view_obj)
+                    )
+                    self.assertEqual(
+                        model_admin.get_fieldsets(self.request, view_obj),
+                        get_uncached_fieldsets(model_admin, self.request, view_obj)
+                    )
+
+    def test_form_fields(self):
+        self.assertLayoutUncached(NoteAdmin(Note, self.site), self.note)
+
+    def test_declared_fields(self):
+        model_admin = DeclaredFieldsNoteAdmin(Note, self.site)
+        self.assertEqual(model_admin.get_fields(self.request), [
+            'reference', 'text_detail_metafield', ('text', 'text_detail'), 'url', 'text_metafield'
+        ])
+        self.assertLayoutUncached(model_admin, self.note)
+
+    def test_first_index(self):
+        model_admin = FirstIndexNoteAdmin(Note, self.site)
+        self.assertEqual(
+            model_admin.get_fields(self.request), ['url', 'url_metafield', 'text', 'text_detail']
+        )
+        self.assertLayoutUncached(model_admin, self.note)
+
+    def test_fieldsets(self):
+        self.assertLayoutUncached(FieldsetsNoteAdmin(Note, self.site), self.note)
+
+    def test_add_and_change_views(self):
+        model_admin = ReadOnlyNoteAdmin(Note, self.site)
+        self.assertNotEqual(
+            model_admin.get_fields(self.request), model_admin.get_fields(self.request, self.note)
+        )
+        self.assertLayoutUncached(model_admin, self.note)
+
+    def test_overridden_get_form(self):
+        model_admin = FormOverrideNoteAdmin(Note, self.site)
+        self.assertIn('text_metafield', model_admin.get_fields(self.request))
+        self.assertIn('url_metafield', model_admin.get_fields(self.request, self.note))
+        self.assertLayoutUncached(model_admin, self.note)
+
+    def test_inlines(self):
+        for inline_class in (RecordItemInline, FieldsetsRecordItemInline):
+            self.assertLayoutUncached(inline_class(Record, self.site), self.record)
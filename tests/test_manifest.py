@@ -0,0 +1,58 @@
+import json
+import re
+from django.forms import ModelForm
+from django.forms.models import BaseModelFormSet, modelformset_factory
+from django.test import SimpleTestCase
+from toggled_widgets import ToggledWidgetFormMixin, ToggledWidgetFormSetMixin
+from .models import Note
+
+class NoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('text', 'url'), ('text_detail', 'reference')]
+
+    class Meta:
+        model = Note
+        fields = '__all__'
+
+def get_manifests(html):
+    return [
+        json.loads(match) for match in re.findall(
+            r'<script type="application/json" class="toggle-manifest">(.*?)</script>', html
+        )
+    ]
+
+class ToggleManifestTestCase(SimpleTestCase):
+    def test_standalone_form_with_formset_like_prefix(self):
+        form = NoteForm(prefix='step-2')
+        manifests = get_manifests(str(form))
+        self.assertEqual(
+            [(m['prefix'], m['formset']) for m in manifests],
+            [('step-2', False), ('step-2', False)]
+        )
+
+    def test_manifest_per_metafield(self):
+        # A group works as long as its own metafield is rendered, whether or
+        # not the other groups' metafields are.
+        form = NoteForm()
+        manifests = get_manifests(str(form['text_detail_metafield']))
+        self.assertEqual(manifests, [{
+            'prefix': None,
+            'formset': False,
+            'groups': [['text_detail_metafield', [['text_detail', []], ['reference', []]]]]
+        }])
+
+    def test_formset(self):
+        formset_class = modelformset_factory(
+            Note, form=NoteForm, formset=ToggledWidgetFormSetMixin.mix_into(BaseModelFormSet),
+            extra=3
+        )
+        formset = formset_class(queryset=Note.objects.none(), prefix='notes')
+        manifests = [get_manifests(str(form)) for form in formset.forms]
+        self.assertEqual(len(manifests[0]), 2)
+        self.assertEqual(manifests[1:], [[], []])
+        self.assertEqual(
+            {(m['prefix'], m['formset']) for m in manifests[0]}, {('notes', True)}
+        )
+        self.assertEqual(
+            {(m['prefix'], m['formset']) for m in get_manifests(str(formset.empty_form))},
+            {('notes', True)}
+        )
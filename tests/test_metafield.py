@@ -0,0 +1,38 @@
+from django.forms import ModelForm
+from django.test import SimpleTestCase
+from toggled_widgets import MetafieldWidget, ToggledWidgetFormMixin
+from .models import Note
+
+class NoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('text', 'url', 'reference')]
+
+    class Meta:
+        model = Note
+        fields = ('text', 'url', 'reference')
+
+class MetafieldRenderCacheTestCase(SimpleTestCase):
+    def get_widgets(self):
+        widget = NoteForm().fields['text_metafield'].widget
+        uncached_widget = MetafieldWidget(attrs=widget.attrs, choices=widget.choices)
+        uncached_widget.cache_renders = False
+        return widget, uncached_widget
+
+    def test_cached_render_matches_uncached(self):
+        widget, uncached_widget = self.get_widgets()
+        for name in ('text_metafield', 'notes-3-text_metafield'):
+            for value in ('text', 'url', '', 'junk'):
+                for i in range(2):
+                    self.assertEqual(
+                        widget.render(name, value, {'id': 'id_' + name}),
+                        uncached_widget.render(name, value, {'id': 'id_' + name})
+                    )
+
+    def test_submitted_values_not_cached(self):
+        widget = self.get_widgets()[0]
+        for value in ('text', 'url', 'reference', ''):
+            widget.render('text_metafield', value)
+        size = len(widget._render_cache)
+        for i in range(1000):
+            html = widget.render('text_metafield', 'junk{}'.format(i))
+        self.assertEqual(len(widget._render_cache), size)
+        self.assertIn('name="text_metafield"', html)
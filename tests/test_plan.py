@@ -0,0 +1,48 @@
+from django.forms import CharField, IntegerField, ModelForm
+from django.test import SimpleTestCase
+from toggled_widgets import ToggledWidgetFormMixin
+from .models import Note
+
+class AddedMemberNoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('text', ('extra', 'extra_count'))]
+
+    class Meta:
+        model = Note
+        fields = ['text']
+
+    def __modify_fields__(self, *args, **kwargs):
+        self.fields['extra'] = CharField(label='Extra thing', required=False)
+        self.fields['extra_count'] = IntegerField(required=False)
+
+class AddedMemberTestCase(SimpleTestCase):
+    def test_label_from_form_fields(self):
+        form = AddedMemberNoteForm()
+        self.assertEqual(
+            list(form.fields['text_metafield'].choices),
+            [('text', 'Text'), ('extra', 'Extra thing')]
+        )
+
+    def test_inactive_added_member_set_empty(self):
+        form = AddedMemberNoteForm(data={
+            'text': 'a', 'extra': 'b', 'extra_count': '3', 'text_metafield': 'text'
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['text'], 'a')
+        self.assertEqual(form.cleaned_data['extra'], '')
+        self.assertIsNone(form.cleaned_data['extra_count'])
+
+    def test_active_added_member(self):
+        form = AddedMemberNoteForm(data={
+            'text': 'a', 'extra': 'b', 'extra_count': '3', 'text_metafield': 'extra'
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['text'], '')
+        self.assertEqual(form.cleaned_data['extra'], 'b')
+        self.assertEqual(form.cleaned_data['extra_count'], 3)
+
+    def test_resolver(self):
+        resolver = AddedMemberNoteForm.get_toggle_resolver()
+        self.assertEqual(
+            resolver.resolve({'text': 'a', 'extra': 'b', 'text_metafield': 'text'}),
+            {'text': 'a', 'extra': '', 'extra_count': ''}
+        )
@@ -0,0 +1,56 @@
+from django.forms import ModelForm
+from django.forms.models import inlineformset_factory
+from django.test import TestCase
+from toggled_widgets import ToggledWidgetFormMixin
+from .models import Record, RecordItem, Target
+
+class RecordForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('first_target', 'second_target')]
+
+    class Meta:
+        model = Record
+        fields = '__all__'
+
+class RecordItemForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('first_target', 'second_target')]
+
+    class Meta:
+        model = RecordItem
+        fields = '__all__'
+
+class InitialToggleQueryTestCase(TestCase):
+    """
+    Choosing the initially visible member of a group of foreign keys must use
+    the stored keys rather than loading the related objects.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.targets = Target.objects.bulk_create([
+            Target(name='First'), Target(name='Second')
+        ])
+        cls.record = Record.objects.create(second_target=cls.targets[1])
+        RecordItem.objects.bulk_create([
+            RecordItem(record=cls.record, second_target=cls.targets[i % 2]) if i % 3 else
+            RecordItem(record=cls.record, first_target=cls.targets[i % 2])
+            for i in range(200)
+        ])
+
+    def test_model_form(self):
+        record = Record.objects.get(pk=self.record.pk)
+        with self.assertNumQueries(0):
+            form = RecordForm(instance=record)
+        self.assertTrue(form.fields['first_target'].widget.is_hidden)
+        self.assertFalse(form.fields['second_target'].widget.is_hidden)
+        self.assertEqual(form.fields['first_target_metafield'].initial, 'second_target')
+
+    def test_inline_formset(self):
+        formset_class = inlineformset_factory(
+            Record, RecordItem, form=RecordItemForm, extra=0
+        )
+        # The only query is the one for the rows themselves.
+        with self.assertNumQueries(1):
+            forms = formset_class(instance=self.record).forms
+        self.assertEqual(len(forms), 200)
+        for form in forms:
+            active = 'second_target' if form.instance.second_target_id else 'first_target'
+            self.assertEqual(form.fields['first_target_metafield'].initial, active)
@@ -0,0 +1,108 @@
+from django.forms import ModelForm
+from django.test import SimpleTestCase
+from toggled_widgets import ToggledWidgetFormMixin
+from .models import Note, Record
+
+class NoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [(('text', 'text_detail'), 'url')]
+
+    class Meta:
+        model = Note
+        fields = '__all__'
+
+class RecordForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [('first_target', 'second_target')]
+
+    class Meta:
+        model = Record
+        fields = '__all__'
+
+class ToggleResolverTestCase(SimpleTestCase):
+    def setUp(self):
+        self.resolver = NoteForm.get_toggle_resolver()
+
+    def test_resolve(self):
+        row = {
+            'text': 'a', 'text_detail': 'b', 'url': 'c', 'reference': 'd',
+            'text_metafield': 'url'
+        }
+        self.assertEqual(self.resolver.resolve(row), {
+            'text': '', 'text_detail': '', 'url': 'c', 'reference': 'd'
+        })
+        # The given dict is left alone.
+        self.assertEqual(row['text'], 'a')
+
+    def test_resolve_in_place(self):
+        row = {'text': 'a', 'url': 'c', 'text_metafield': 'text'}
+        result = self.resolver.resolve(row, in_place=True)
+        self.assertIs(result, row)
+        # The active member's cohorts are left alone, even if missing.
+        self.assertEqual(row, {'text': 'a', 'url': ''})
+
+    def test_include_metafields(self):
+        self.assertEqual(
+            self.resolver.resolve({'url': 'c'}, include_metafields=True),
+            {'text': '', 'text_detail': '', 'url': 'c', 'text_metafield': 'url'}
+        )
+
+    def test_inference_without_metafield(self):
+        # The active member is the last one with a value, or the first one.
+        for row, active in (
+            ({}, 'text'),
+            ({'text': '', 'url': ''}, 'text'),
+            ({'text': 'a'}, 'text'),
+            ({'url': 'c'}, 'url'),
+            ({'text': 'a', 'url': 'c'}, 'url'),
+            ({'text': 'a', 'url': 'c', 'text_metafield': ''}, 'url'),
+        ):
+            with self.subTest(row=row):
+                self.assertEqual(self.resolver.get_active_members(row), {'text_metafield': active})
+
+    def test_get_active_members_does_not_modify(self):
+        row = {'text': 'a', 'url': 'c', 'text_metafield': 'text'}
+        self.assertEqual(self.resolver.get_active_members(row), {'text_metafield': 'text'})
+        self.assertEqual(row, {'text': 'a', 'url': 'c', 'text_metafield': 'text'})
+
+    def test_invalid_metafield_value(self):
+        for value in ('reference', 'text_detail', 'bogus'):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    self.resolver.resolve({'text': 'a', 'text_metafield': value})
+                with self.assertRaises(ValueError):
+                    self.resolver.get_active_members({'text_metafield': value})
+
+    def test_iter_resolve(self):
+        rows = iter([{'text': 'a', 'url': 'c'}, {'text': 'a', 'text_metafield': 'text'}])
+        results = self.resolver.iter_resolve(rows)
+        self.assertEqual(next(results), {'text': '', 'text_detail': '', 'url': 'c'})
+        self.assertEqual(next(results), {'text': 'a', 'url': ''})
+        self.assertEqual(list(results), [])
+
+    def test_resolve_batch(self):
+        rows = [{'url': 'c'}, {'text': 'a', 'text_metafield': 'text'}]
+        self.assertEqual(self.resolver.resolve_batch(rows), [
+            {'text': '', 'text_detail': '', 'url': 'c'},
+            {'text': 'a', 'url': ''}
+        ])
+
+    def test_empty_values_of_foreign_keys(self):
+        resolver = RecordForm.get_toggle_resolver()
+        self.assertEqual(
+            resolver.resolve({
+                'first_target': 1, 'second_target': 2, 'first_target_metafield': 'first_target'
+            }),
+            {'first_target': 1, 'second_target': None}
+        )
+
+    def test_matches_form_cleaned_data(self):
+        for metafield_value in ('text', 'url'):
+            data = {
+                'text': 'a', 'text_detail': 'b', 'url': 'c', 'reference': 'd',
+                'text_metafield': metafield_value
+            }
+            with self.subTest(metafield_value=metafield_value):
+                form = NoteForm(data)
+                self.assertTrue(form.is_valid(), form.errors)
+                self.assertEqual(
+                    self.resolver.resolve(data, include_metafields=True), form.cleaned_data
+                )
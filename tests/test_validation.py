@@ -0,0 +1,79 @@
+from django.core.exceptions import ValidationError
+from django.forms import ModelForm
+from django.test import SimpleTestCase
+from toggled_widgets import ToggledWidgetFormMixin
+from .models import Note
+
+class SkippingNoteForm(ToggledWidgetFormMixin, ModelForm):
+    toggle_groups = [(('text', 'text_detail'), 'url')]
+    skip_inactive_validation = True
+
+    class Meta:
+        model = Note
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cleaned_fields = []
+
+    def clean_text_detail(self):
+        self.cleaned_fields.append('text_detail')
+        if self.cleaned_data['text_detail'] == 'bad':
+            raise ValidationError('Bad detail.')
+        return self.cleaned_data['text_detail']
+
+    def clean_url(self):
+        self.cleaned_fields.append('url')
+        if self.cleaned_data['url'] == 'bad':
+            raise ValidationError('Bad URL.')
+        return self.cleaned_data['url']
+
+    def clean_text(self):
+        self.cleaned_fields.append('text')
+        if self.cleaned_data['text'] == 'conflict':
+            # Active fields may still refer to inactive ones.
+            self.fields['url'].help_text = 'Conflicts with the text.'
+            self.add_error('url', 'Conflicts with the text.')
+        return self.cleaned_data['text']
+
+class SkipInactiveValidationTestCase(SimpleTestCase):
+    def test_inactive_errors_suppressed(self):
+        form = SkippingNoteForm(data={
+            'text': 'a', 'text_detail': 'b', 'url': 'bad', 'reference': 'r',
+            'text_metafield': 'text'
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertNotIn('url', form.cleaned_fields)
+        self.assertEqual(form.cleaned_data['url'], '')
+
+    def test_inactive_cohort_skipped(self):
+        form = SkippingNoteForm(data={
+            'text': 'a', 'text_detail': 'bad', 'url': 'u', 'reference': 'r',
+            'text_metafield': 'url'
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_fields, ['url'])
+        self.assertEqual(form.cleaned_data['text'], '')
+        self.assertEqual(form.cleaned_data['text_detail'], '')
+        self.assertEqual(form.cleaned_data['url'], 'u')
+        self.assertEqual(form.cleaned_data['reference'], 'r')
+
+    def test_fields_intact_during_cleaning(self):
+        form = SkippingNoteForm(data={
+            'text': 'conflict', 'text_detail': '', 'url': 'u', 'reference': '',
+            'text_metafield': 'text'
+        })
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['url'], ['Conflicts with the text.'])
+        self.assertEqual(form['url'].help_text, 'Conflicts with the text.')
+        self.assertIn('url', form.fields)
+
+    def test_invalid_metafield_validates_all_fields(self):
+        form = SkippingNoteForm(data={
+            'text': 'a', 'text_detail': 'b', 'url': 'bad', 'reference': '',
+            'text_metafield': 'bogus'
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('text_metafield', form.errors)
+        self.assertEqual(form.errors['url'], ['Bad URL.'])
+        self.assertEqual(sorted(form.cleaned_fields), ['text', 'text_detail', 'url'])
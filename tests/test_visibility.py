@@ -0,0 +1,131 @@
+import random
+import threading
+from django.core.exceptions import ValidationError
+from django.forms import CharField, ModelForm
+from django.test import SimpleTestCase
+from toggled_widgets import ToggledWidgetFormMixin
+from .models import Note
+
+GROUPS = 4
+MEMBERS = 12
+COHORTS = 3
+
+def build_wide_form_class():
+    """
+    Returns a new form class with GROUPS toggle groups of MEMBERS members,
+    each with COHORTS cohorts.
+    """
+    attrs = {}
+    toggle_groups = []
+    for g in range(GROUPS):
+        group = []
+        for m in range(MEMBERS):
+            field_name = 'g{}m{}'.format(g, m)
+            cohorts = tuple('{}c{}'.format(field_name, c) for c in range(COHORTS))
+            for name in (field_name,) + cohorts:
+                attrs[name] = CharField(required=False)
+            group.append((field_name,) + cohorts)
+        toggle_groups.append(group)
+    attrs.update({
+        'toggle_groups': toggle_groups,
+        'Meta': type('Meta', (), {'model': Note, 'fields': ()}),
+        '__module__': __name__
+    })
+    return type('WideForm', (ToggledWidgetFormMixin, ModelForm), attrs)
+
+def get_visibility_errors(form, active):
+    """
+    Returns a list of descriptions of the ways in which the visibility of the
+    given form's toggled widgets disagrees with the given dict associating
+    each metafield name with the name of its group's active member.
+    """
+    errors = []
+    for group_plan in form.get_toggle_plan().groups:
+        expected = active[group_plan.metafield_name]
+        visible = [
+            member.field_name for member in group_plan.members
+            if not form.fields[member.field_name].widget.is_hidden
+        ]
+        if visible != [expected]:
+            errors.append('{} visible instead of {}'.format(visible, expected))
+        initial = form.fields[group_plan.metafield_name].initial
+        if initial != expected:
+            errors.append('{} is {} instead of {}'.format(
+                group_plan.metafield_name, initial, expected
+            ))
+        for member in group_plan.members:
+            is_hidden = form.fields[member.field_name].widget.is_hidden
+            for cohort in member.cohorts:
+                if form.fields[cohort].widget.is_hidden != is_hidden:
+                    errors.append('{} does not follow {}'.format(cohort, member.field_name))
+    return errors
+
+def exercise_form(form_class, rng, error_count):
+    """
+    Validates a form with random metafield values, then adds errors to random
+    toggled fields and cohorts, checking the visibility after each one.
+    Returns a list of descriptions of any disagreements.
+    """
+    plan = form_class.get_toggle_plan()
+    data = {}
+    active = {}
+    # Each field name involved in a toggle relationship, mapped to the
+    # metafield and member that it reveals
+    revealing = {}
+    for group_plan in plan.groups:
+        member = rng.choice(group_plan.members)
+        data[group_plan.metafield_name] = active[group_plan.metafield_name] = member.field_name
+        for member in group_plan.members:
+            for field_name in (member.field_name,) + member.cohorts:
+                revealing[field_name] = (group_plan.metafield_name, member.field_name)
+    form = form_class(data)
+    if not form.is_valid():
+        return [form.errors.as_text()]
+    errors = get_visibility_errors(form, active)
+    field_names = sorted(revealing)
+    for i in range(error_count):
+        if i % 5:
+            field_name = rng.choice(field_names)
+            form.add_error(field_name, 'Invalid.')
+            metafield_name, member = revealing[field_name]
+            active[metafield_name] = member
+        else:
+            # Errors may also be added for several fields at once.
+            error_fields = rng.sample(field_names, 3)
+            form.add_error(None, ValidationError({name: 'Invalid.' for name in error_fields}))
+            for field_name in error_fields:
+                metafield_name, member = revealing[field_name]
+                active[metafield_name] = member
+        errors.extend(get_visibility_errors(form, active))
+    return errors
+
+class VisibilityStressTestCase(SimpleTestCase):
+    def test_many_errors(self):
+        form_class = build_wide_form_class()
+        rng = random.Random(18)
+        for i in range(20):
+            self.assertEqual(exercise_form(form_class, rng, 200), [])
+
+    def test_concurrent_forms(self):
+        # Every thread starts with the same new class at once, so that the
+        # compilation of its toggle plan races as well.
+        form_class = build_wide_form_class()
+        thread_count = 8
+        barrier = threading.Barrier(thread_count)
+        errors = []
+
+        def run(seed):
+            rng = random.Random(seed)
+            try:
+                barrier.wait()
+                for i in range(10):
+                    errors.extend(exercise_form(form_class, rng, 100))
+            except Exception as e:
+                errors.append(repr(e))
+
+        threads = [threading.Thread(target=run, args=(seed,)) for seed in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])